@@ -1,5 +1,8 @@
 import dash
 
+from resources import metrics
+
 app = dash.Dash(__name__)
 server = app.server
-app.config.suppress_callback_exceptions = True
\ No newline at end of file
+app.config.suppress_callback_exceptions = True
+metrics.instrument(app)
@@ -1,13 +1,14 @@
+import dash_table
 import pandas as pd
-from math import exp
 import plotly.graph_objects as go
 import dash_core_components as dcc
 import dash_html_components as html
 from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 
 import config
 from app import app
-from resources import functions
+from resources import functions, snapshots, lattice, frames
 
 
 # --------------------------------
@@ -112,6 +113,53 @@ layout = html.Div(
             ]
         ),
 
+        # EXERCISE + CONVERGENCE
+        html.Div(
+            className='row',
+            children=[
+
+                # EXERCISE
+                html.Div(
+                    className='two columns',
+                    children=[
+                        html.H6(children=['Exercise'], style=config.H6_STYLE),
+                        dcc.RadioItems(
+                            id='trees_exercise',
+                            options=[{'label': i, 'value': i} for i in config.TREE_EXERCISES],
+                            value=config.TREE_EXERCISES[0],
+                            labelStyle={'display': 'inline-block', 'margin-right': '10px'}
+                        )
+                    ]
+                ),
+
+                # CONVERGENCE
+                html.Div(
+                    className='three columns',
+                    children=[
+                        html.H6(children=['Convergence'], style=config.H6_STYLE),
+                        dcc.Checklist(
+                            id='trees_convergence',
+                            options=[{'label': i, 'value': i} for i in config.TREE_CONVERGENCE],
+                            value=[],
+                            labelStyle={'display': 'inline-block', 'margin-right': '10px'}
+                        )
+                    ]
+                ),
+
+                # PRICE + GREEKS
+                html.Div(
+                    className='seven columns',
+                    children=[
+                        dash_table.DataTable(
+                            id='trees_greeks',
+                            columns=[{'name': i, 'id': i} for i in ['price', 'delta', 'gamma', 'theta']]
+                        )
+                    ]
+                ),
+
+            ]
+        ),
+
         # TREES
         html.Div(
             className='row',
@@ -124,6 +172,7 @@ layout = html.Div(
 
         # REFRESH
         dcc.Store(id='trees_markets'),
+        dcc.Store(id='trees_digest'),
         dcc.Interval(id='trees_refresh', interval=refresh_rate, n_intervals=0)
 
     ]
@@ -144,11 +193,13 @@ def get_options(coin):
     instruments = list(markets['instrument_name'].unique())
     options = [{'label': i, 'value': i} for i in instruments]
     value = instruments[0]
-    return markets.to_json(orient='split'), options, value
+    return frames.put(markets, 'markets', coin), options, value
 
 
 @app.callback(
-    Output('trees_chart', 'figure'),
+    [Output('trees_chart', 'figure'),
+     Output('trees_greeks', 'data'),
+     Output('trees_digest', 'data')],
     [Input('trees_button', 'n_clicks'),
      Input('trees_refresh', 'n_intervals')],
     [State('trees_coin', 'value'),
@@ -156,81 +207,65 @@ def get_options(coin):
      State('trees_option', 'value'),
      State('trees_vol', 'value'),
      State('trees_steps', 'value'),
-     State('trees_markets', 'data')]
+     State('trees_exercise', 'value'),
+     State('trees_convergence', 'value'),
+     State('trees_markets', 'data'),
+     State('trees_digest', 'data')]
 )
-def build_tree(n_clicks, n_intervals, coin, interest_rate, option, vol, steps, markets):
+def build_tree(n_clicks, n_intervals, coin, interest_rate, option, vol, steps, exercise, convergence, markets, digest):
 
-    if not vol:
-        return {}
+    if not vol or not steps:
+        return {}, [], None
 
     interest_rate = interest_rate / 100
-    markets = pd.read_json(markets, orient='split')
-    ticker = functions.get_ticker(option)
+    markets = frames.get(markets)
     coin, expiry, strike, flag = option.split('-')
     strike = float(strike)
 
-    expiration = markets[markets['instrument_name'] == option]['expiration_timestamp'].values[0]
+    expiration = markets.loc[markets['instrument_name'] == option, 'expiration_timestamp'].iloc[0].timestamp() * 1000
 
     timestamps, delta_t = functions.get_timestamps(expiration, steps)
-    index = ticker.get('index_price')
+    index = snapshots.get_index(coin)
     vol = float(vol/100)
-    u, d, p = functions.get_u_d_p(index, vol, delta_t, interest_rate)
-
-    underlying = [(index,)]
-    for i in range(0, steps):
-        if i == 0:
-            continue
-        else:
-            last_underlying = list(underlying[i-1])
-            new_underlying = []
-            for each_price in last_underlying:
-                up = round(each_price * u, 2)
-                down = round(each_price * d, 2)
-                new_underlying.extend([up, down])
-            new_underlying = list(set(new_underlying))
-            new_underlying.sort(reverse=False)
-            underlying.append(tuple(new_underlying))
-
-    options_prices = [()] * len(underlying)
-    for i in range(1, steps+1):
-        i = steps - i
-        underlying_price_set = list(underlying[i])
-        if i == steps-1:
-            option_price_set = []
-            for each_price in underlying_price_set:
-                option_price = max(each_price - strike, 0) if flag == 'C' else max(strike - each_price, 0)
-                option_price = round(option_price, 2)
-                option_price_set.append(option_price)
-            options_prices[i] = tuple(option_price_set)
-        else:
-            forward_option_price_set = list(options_prices[i + 1])
-            option_price_set = []
-            for j in range(len(underlying_price_set)):
-                price_a = forward_option_price_set[j]
-                price_b = forward_option_price_set[j+1]
-                option_price = ((p * price_a) + ((1 - p) * price_b) * exp(-1 * interest_rate * delta_t))
-                option_price = round(option_price, 2)
-                option_price_set.append(option_price)
-            options_prices[i] = tuple(option_price_set)
-
-    chart_data = []
-    for i in range(len(underlying)):
-        underlying_price_set = list(underlying[i])
-        option_price_set = list(options_prices[i])
-        x = [pd.to_datetime(timestamps[i], unit='ms')] * len(underlying_price_set)
-        chart_data.append(
-            go.Scattergl(
-                x=x,
-                y=underlying_price_set,
-                text=['({}), ({})'.format(underlying_price_set[j], option_price_set[j]) for j in range(len(underlying_price_set))],
-                textposition="top center",
-                mode='markers+text',
-            ),
-        )
+
+    # Nothing to re-render when neither the inputs nor the index have moved
+    new_digest = functions.get_digest(pd.DataFrame([{
+        'option': option, 'index': index, 'vol': vol, 'steps': steps, 'interest_rate': interest_rate,
+        'exercise': exercise, 'convergence': ','.join(sorted(convergence))
+    }]))
+    if new_digest == digest:
+        raise PreventUpdate
+
+    export_steps, max_nodes = lattice.get_level_of_detail(steps, config.TREE_MAX_POINTS)
+    pricer = lattice.price_extrapolated if 'richardson' in convergence else lattice.price
+    price, greeks, nodes = pricer(
+        index, strike, delta_t * steps, vol, interest_rate, flag, steps, export_steps, max_nodes,
+        american=exercise == 'american', smoothing='smoothing' in convergence or 'richardson' in convergence
+    )
+
+    # One trace for the whole tree; labels only while they stay legible
+    node_steps, underlying_price_set, option_price_set = lattice.get_node_arrays(nodes)
+    labelled = len(underlying_price_set) <= config.TREE_LABEL_POINTS
+    chart_data = [
+        go.Scattergl(
+            x=pd.to_datetime(timestamps[node_steps], unit='ms'),
+            y=underlying_price_set,
+            text=['({}), ({})'.format(a, b) for a, b in zip(underlying_price_set.round(2), option_price_set.round(2))],
+            textposition="top center",
+            mode='markers+text' if labelled else 'markers',
+            marker={'size': 6 if labelled else 3},
+        ),
+    ]
 
     chart_layout = {
         'margin': {'t': 40, 'b': 40, 'l': 40, 'r': 40},
         'showlegend': False,
         'height': 800
     }
-    return {'data': chart_data, 'layout': chart_layout}
+    greeks_df = {
+        'price': round(price, 2),
+        'delta': round(greeks['delta'], 4),
+        'gamma': round(greeks['gamma'], 8),
+        'theta': round(greeks['theta'], 2)
+    }
+    return {'data': chart_data, 'layout': chart_layout}, [greeks_df], new_digest
@@ -1,7 +1,6 @@
 import dash_table
 import numpy as np
 import pandas as pd
-from math import sqrt
 import plotly.graph_objects as go
 import dash_core_components as dcc
 import dash_html_components as html
@@ -9,7 +8,7 @@ from dash.dependencies import Input, Output, State
 
 import config
 from app import app
-from resources import functions
+from resources import functions, snapshots, montecarlo, frames
 
 
 # --------------------------------
@@ -108,6 +107,72 @@ layout = html.Div(
             ]
         ),
 
+        # VARIANCE REDUCTION
+        html.Div(
+            className='row',
+            children=[
+
+                # METHOD
+                html.Div(
+                    className='two columns',
+                    children=[
+                        html.H6(children=['Method'], style=config.H6_STYLE),
+                        dcc.Dropdown(
+                            id='mc_method',
+                            options=[{'label': i, 'value': i} for i in config.MC_METHODS],
+                            value=config.MC_METHODS[0],
+                            clearable=False,
+                            style={'width': '100%'}
+                        ),
+                    ]
+                ),
+
+                # SEED
+                html.Div(
+                    className='one column',
+                    children=[
+                        html.H6(children=['Seed'], style=config.H6_STYLE),
+                        dcc.Input(
+                            id='mc_seed',
+                            type='number',
+                            min=0,
+                            step=1,
+                            style={'width': '100%'}
+                        )
+                    ]
+                ),
+
+                # CHART MODE
+                html.Div(
+                    className='two columns',
+                    children=[
+                        html.H6(children=['Chart'], style=config.H6_STYLE),
+                        dcc.RadioItems(
+                            id='mc_chart_mode',
+                            options=[{'label': i, 'value': i} for i in config.MC_CHART_MODES],
+                            value=config.MC_CHART_MODES[0],
+                            labelStyle={'display': 'inline-block', 'margin-right': '10px'}
+                        )
+                    ]
+                ),
+
+                # TARGET ERROR
+                html.Div(
+                    className='two columns',
+                    children=[
+                        html.H6(children=['Target Std. Error'], style=config.H6_STYLE),
+                        dcc.Input(
+                            id='mc_target_error',
+                            type='number',
+                            min=0,
+                            style={'width': '100%'}
+                        )
+                    ]
+                ),
+
+            ]
+        ),
+
         html.Div(
             className='row',
             children=[
@@ -125,7 +190,7 @@ layout = html.Div(
                         html.H6(children=['Expected Payoff (dollar amount)'], style=config.H6_STYLE),
                         dash_table.DataTable(
                             id='mc_payoff',
-                            columns=[{'name': i, 'id': i} for i in ['mean_payoff', 'std', 'std_error', 'range', 'B.S. price']]
+                            columns=[{'name': i, 'id': i} for i in ['mean_payoff', 'std', 'std_error', 'range', 'p5', 'p50', 'p95', 'B.S. price']]
                         )
                     ]
                 ),
@@ -153,7 +218,7 @@ def get_options(coin):
     instruments = list(markets['instrument_name'].unique())
     options = [{'label': i, 'value': i} for i in instruments]
     value = instruments[0]
-    return markets.to_json(orient='split'), options, value
+    return frames.put(markets, 'markets', coin), options, value
 
 
 @app.callback(
@@ -165,38 +230,64 @@ def get_options(coin):
      State('mc_option', 'value'),
      State('mc_vol', 'value'),
      State('mc_steps', 'value'),
+     State('mc_method', 'value'),
+     State('mc_target_error', 'value'),
+     State('mc_seed', 'value'),
+     State('mc_chart_mode', 'value'),
      State('mc_markets', 'data')]
 )
-def run_simulations(n_clicks, coin, interest_rate, option, vol, sims, markets):
+def run_simulations(n_clicks, coin, interest_rate, option, vol, sims, method, target_error, seed, chart_mode, markets):
 
     if not vol:
         return {}, []
 
-    markets = pd.read_json(markets, orient='split')
+    markets = frames.get(markets)
     coin, expiry, strike, flag = option.split('-')
-    expiration = markets[markets['instrument_name'] == option]['expiration_timestamp'].values[0]
+    expiration = markets.loc[markets['instrument_name'] == option, 'expiration_timestamp'].iloc[0].timestamp() * 1000
 
-    ticker = functions.get_ticker(option)
-    index = ticker.get('index_price')
+    index = snapshots.get_index(coin)
     vol = float(vol/100)
     interest_rate = interest_rate / 100
     strike = float(strike)
 
-    timestamps, price_series, payoffs = functions.get_monte_carlo_simulations(
-        index, interest_rate, vol, expiration, flag, strike, sims, 60*60
+    timestamps, price_series, statistics = functions.get_monte_carlo_simulations(
+        index, interest_rate, vol, expiration, flag, strike, sims,
+        method=method, target_error=target_error, max_sims=config.MC_MAX_SIMULATIONS, seed=seed
     )
 
-    timestamps = [pd.to_datetime(i, unit='ms') for i in timestamps]
+    timestamps = pd.to_datetime(timestamps, unit='ms').values
 
-    chart_data = []
-    for i in range(len(price_series)):
-        chart_data.append(
+    if chart_mode == 'paths':
+        # All sampled paths in one trace, separated by gaps
+        chart_data = [
             go.Scattergl(
-                x=timestamps,
-                y=price_series[i],
+                x=np.tile(np.append(timestamps, np.datetime64('NaT')), len(price_series)),
+                y=np.hstack([price_series, np.full((len(price_series), 1), np.nan)]).ravel(),
                 mode='lines',
+                line={'width': 1},
             ),
-        )
+        ]
+    else:
+        fan = montecarlo.get_fan(price_series)
+        chart_data = [
+            go.Scattergl(x=timestamps, y=fan[0], mode='lines', line={'width': 0}, name='5%'),
+            go.Scattergl(x=timestamps, y=fan[4], mode='lines', line={'width': 0}, fill='tonexty',
+                         fillcolor='rgba(31, 119, 180, 0.15)', name='95%'),
+            go.Scattergl(x=timestamps, y=fan[1], mode='lines', line={'width': 0}, name='25%'),
+            go.Scattergl(x=timestamps, y=fan[3], mode='lines', line={'width': 0}, fill='tonexty',
+                         fillcolor='rgba(31, 119, 180, 0.3)', name='75%'),
+            go.Scattergl(x=timestamps, y=fan[2], mode='lines', line={'color': 'rgb(31, 119, 180)'}, name='50%'),
+        ]
+        for each_path in price_series[:config.MC_SAMPLE_PATHS]:
+            chart_data.append(
+                go.Scattergl(
+                    x=timestamps,
+                    y=each_path,
+                    mode='lines',
+                    line={'width': 1},
+                    opacity=0.5,
+                ),
+            )
 
     chart_layout = {
         'margin': {'t': 40, 'b': 40, 'l': 40, 'r': 40},
@@ -204,13 +295,16 @@ def run_simulations(n_clicks, coin, interest_rate, option, vol, sims, markets):
     }
 
     payoff_df = {
-        'mean_payoff': round(np.mean(payoffs), 2),
-        'std': round(np.std(payoffs), 2),
-        'std_error': round(np.std(payoffs) / sqrt(sims), 2),
+        'mean_payoff': round(statistics['mean'], 2),
+        'std': round(statistics['std'], 2),
+        'std_error': round(statistics['std_error'], 2),
         'range': '{} - {}'.format(
-            round(np.mean(payoffs) - (1.96 * (np.std(payoffs) / sqrt(sims))), 2),
-            round(np.mean(payoffs) + (1.96 * (np.std(payoffs) / sqrt(sims))), 2)
+            round(statistics['mean'] - (1.96 * statistics['std_error']), 2),
+            round(statistics['mean'] + (1.96 * statistics['std_error']), 2)
         ),
+        'p5': round(statistics['quantiles'][5], 2),
+        'p50': round(statistics['quantiles'][50], 2),
+        'p95': round(statistics['quantiles'][95], 2),
         'B.S. price': round(functions.get_bs_price(index, strike, expiration, vol, interest_rate, flag), 2)
     }
     payoff_df = pd.DataFrame([payoff_df])
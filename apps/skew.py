@@ -4,10 +4,11 @@ import plotly.graph_objects as go
 import dash_core_components as dcc
 import dash_html_components as html
 from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 
 import config
 from app import app
-from resources import functions
+from resources import functions, snapshots, frames
 
 
 # --------------------------------
@@ -141,6 +142,7 @@ layout = html.Div(
 
         # STORAGE
         dcc.Store(id='skew_markets'),
+        dcc.Store(id='iv_digest'),
         dcc.Interval(id='iv_refresh', interval=refresh_rate, n_intervals=0)
 
     ]
@@ -161,28 +163,36 @@ def get_maturities(coin):
     expirations = list(markets['expiration_timestamp'].dt.strftime('%d-%B-%Y').unique())
     options = [{'label': i, 'value': i} for i in expirations]
     value = expirations[0]
-    return markets.to_json(orient='split'), options, value
+    return frames.put(markets, 'markets', coin), options, value
 
 
 @app.callback(
     [Output('iv_calls', 'data'),
-     Output('iv_puts', 'data')],
+     Output('iv_puts', 'data'),
+     Output('iv_digest', 'data')],
     [Input('iv_refresh', 'n_intervals'),
      Input('iv_skew_button', 'n_clicks')],
     [State('iv_expiration', 'value'),
      State('skew_markets', 'data'),
-     State('iv_interest_rate', 'value')]
+     State('iv_interest_rate', 'value'),
+     State('iv_digest', 'data')]
 )
-def get_options(n_intervals, n_clicks, expiration, markets, interest_rate):
+def get_options(n_intervals, n_clicks, expiration, markets, interest_rate, digest):
     if expiration and markets:
-        markets = pd.read_json(markets, orient='split')
+        markets = frames.get(markets)
         coin = markets['base_currency'].unique()[0]
-        tickers = functions.get_tickers(coin)
-        options = functions.prepare_options(markets, tickers, [expiration], interest_rate)
+        options = snapshots.get_options(coin, interest_rate, [expiration])
+        options = options[config.IV_COLUMNS + ['flag']]
+
+        # Nothing to re-render when the tables have not changed
+        new_digest = functions.get_digest(options)
+        if new_digest == digest:
+            raise PreventUpdate
+
         calls = options[options['flag'] == 'c']
         puts = options[options['flag'] == 'p']
-        return calls.to_dict('rows'), puts.to_dict('rows')
-    return [], []
+        return calls.to_dict('rows'), puts.to_dict('rows'), new_digest
+    return [], [], None
 
 
 @app.callback(
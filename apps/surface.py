@@ -8,7 +8,7 @@ from dash.dependencies import Input, Output, State
 
 import config
 from app import app
-from resources import functions
+from resources import functions, snapshots, frames, calibration
 
 
 # --------------------------------
@@ -92,6 +92,12 @@ layout = html.Div(
                             value=config.IV_CPS[0],
                             labelStyle={'display': 'inline-block', 'margin-right': '10px'}
                         ),
+                        dcc.RadioItems(
+                            id='surface_model',
+                            options=[{'label': i, 'value': i} for i in config.SMILE_MODELS],
+                            value=config.SMILE_MODELS[0],
+                            labelStyle={'display': 'inline-block', 'margin-right': '10px'}
+                        ),
                         html.Button(
                             id='surface_button',
                             children='GET SURFACE',
@@ -179,6 +185,19 @@ layout = html.Div(
                             ]
                         ),
 
+                        # Portfolio Greeks
+                        html.Div(
+                            className='row',
+                            style={'margin-top': '20px'},
+                            children=[
+                                html.H6(children=['Portfolio Greeks'], style=config.H6_STYLE),
+                                dash_table.DataTable(
+                                    id='pricer_portfolio',
+                                    columns=[{'name': i, 'id': i} for i in config.PORTFOLIO_COLUMNS]
+                                ),
+                            ]
+                        ),
+
                     ]
                 ),
 
@@ -223,7 +242,7 @@ layout = html.Div(
 )
 def get_markets(coin):
     markets = functions.get_markets(coin, ['option'])
-    return markets.to_json(orient='split')
+    return frames.put(markets, 'markets', coin)
 
 
 @app.callback(
@@ -239,11 +258,9 @@ def get_markets(coin):
 def get_surface(n_clicks, markets, interest_rate, side, cp, limit):
     if not markets:
         return [], []
-    interest_rate = interest_rate / 100
-    markets = pd.read_json(markets, orient='split')
+    markets = frames.get(markets)
     coin = markets['base_currency'].unique()[0]
-    tickers = functions.get_tickers(coin)
-    options = functions.prepare_options(markets, tickers, [], interest_rate)
+    options = snapshots.get_options(coin, interest_rate)
     options = options[options['flag'] == cp]
     surface = functions.build_vol_surface(options, side)
     index = options['index'].unique()[0]
@@ -256,9 +273,14 @@ def get_surface(n_clicks, markets, interest_rate, side, cp, limit):
     [Output('iv_vs_strike', 'figure'),
      Output('iv_vs_expiry', 'figure')],
     [Input('vol_surface', 'active_cell')],
-    [State('vol_surface', 'data')]
+    [State('vol_surface', 'data'),
+     State('surface_coin', 'value'),
+     State('surface_interest_rate', 'value'),
+     State('surface_side', 'value'),
+     State('surface_cp', 'value'),
+     State('surface_model', 'value')]
 )
-def make_charts(active_cell, data):
+def make_charts(active_cell, data, coin, interest_rate, side, cp, model):
 
     if active_cell and data:
 
@@ -276,18 +298,13 @@ def make_charts(active_cell, data):
         iv_vs_strike = iv_vs_strike[~iv_vs_strike['iv'].isna()]
         iv_vs_expiry = iv_vs_expiry[~iv_vs_expiry['iv'].isna()]
 
-        # Fit model (IV STRIKE)
-        coef_iv_vs_strike = np.polyfit(
-            np.array(pd.to_numeric(iv_vs_strike['strike'])),
-            np.array(pd.to_numeric(iv_vs_strike['iv'])),
-            3
-        )
-        spl_iv_vs_strike = np.poly1d(coef_iv_vs_strike)
+        # Fitted smile (IV STRIKE), calibrated once per snapshot
+        fits = snapshots.get_fits(coin, interest_rate, side, cp, model)
         xx_iv_vs_strike = np.linspace(
             pd.to_numeric(iv_vs_strike['strike']).min(),
             pd.to_numeric(iv_vs_strike['strike']).max()
         )
-        yy_iv_vs_strike = spl_iv_vs_strike(xx_iv_vs_strike)
+        yy_iv_vs_strike = calibration.get_vol(fits, expiry, xx_iv_vs_strike)
 
         # First Chart
         data_iv_vs_strike = [
@@ -336,6 +353,7 @@ def make_charts(active_cell, data):
 
 @app.callback(
     [Output('pricer_table', 'data'),
+     Output('pricer_portfolio', 'data'),
      Output('add_option_clicks', 'children'),
      Output('pricer_clicks', 'children')],
     [Input('vol_surface', 'active_cell'),
@@ -343,18 +361,21 @@ def make_charts(active_cell, data):
      Input('pricer_button', 'n_clicks')],
     [State('surface_coin', 'value'),
      State('surface_interest_rate', 'value'),
+     State('surface_side', 'value'),
+     State('surface_cp', 'value'),
+     State('surface_model', 'value'),
      State('vol_surface', 'data'),
      State('pricer_table', 'data'),
+     State('pricer_portfolio', 'data'),
      State('add_option_clicks', 'children'),
      State('pricer_clicks', 'children')]
 )
-def fill_pricing_table(active_cell, add_option, price_option, coin, interest_rate, vol_surface, pricer_table, add_option_clicks, pricer_clicks):
+def fill_pricing_table(active_cell, add_option, price_option, coin, interest_rate, side, cp, model, vol_surface, pricer_table, portfolio, add_option_clicks, pricer_clicks):
     add_option_clicks = int(add_option_clicks)
     pricer_clicks = int(pricer_clicks)
-    interest_rate = interest_rate / 100
 
     if not active_cell and not vol_surface:
-        return pricer_table, add_option_clicks, pricer_clicks
+        return pricer_table, portfolio, add_option_clicks, pricer_clicks
 
     # Expiry and Strike
     expiry = vol_surface[active_cell['row']]['expiration']
@@ -364,39 +385,21 @@ def fill_pricing_table(active_cell, add_option, price_option, coin, interest_rat
 
         pricer_table = pricer_table + [{
             'expiry': expiry + ' 08:00:00',
-            'interest': interest_rate
+            'quantity': 1,
+            'interest': interest_rate / 100
         }]
         add_option_clicks = add_option
 
-        return pricer_table, add_option_clicks, pricer_clicks
+        return pricer_table, portfolio, add_option_clicks, pricer_clicks
 
     if pricer_clicks != price_option:
 
-        # IV Dataframes
-        iv_vs_strike = pd.DataFrame([
-            {'strike': key, 'iv': value} for key, value in vol_surface[active_cell['row']].items() if key != 'expiration'
-        ])
-        iv_vs_strike = iv_vs_strike[~iv_vs_strike['iv'].isna()]
-        iv_vs_strike['strike'] = pd.to_numeric(iv_vs_strike['strike'])
-        iv_vs_strike['iv'] = pd.to_numeric(iv_vs_strike['iv'])
-
-        # Fit model
-        coeffs = np.polyfit(
-            np.array(iv_vs_strike['strike']),
-            np.array(iv_vs_strike['iv']),
-            3
-        )
-        fit_model = np.poly1d(coeffs)
-        xx = np.linspace(
-            iv_vs_strike['strike'].min(),
-            iv_vs_strike['strike'].max()
-        )
-        yy = fit_model(xx)
-
-        # PRICE
-        pricer_table = functions.price_options(pricer_table, coin, interest_rate, fit_model)
+        # PRICE off the snapshot's dense vol grid, at any strike and expiry
+        surface = snapshots.get_grid(coin, interest_rate, side, cp, model)
+        pricer_table = functions.price_options(pricer_table, interest_rate / 100, surface)
+        portfolio = functions.aggregate_greeks(pricer_table).to_dict('records')
         pricer_clicks = price_option
 
-        return pricer_table, add_option_clicks, pricer_clicks
+        return pricer_table, portfolio, add_option_clicks, pricer_clicks
 
-    return pricer_table, add_option_clicks, pricer_clicks
\ No newline at end of file
+    return pricer_table, portfolio, add_option_clicks, pricer_clicks
\ No newline at end of file
@@ -0,0 +1,278 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+from resources import pricing, functions, lattice, calibration, grid
+
+
+CHAIN_SIZES = [100, 1000, 5000]
+SCALAR_SIZES = [100, 1000]
+TREE_STEPS = [50, 500, 5000]
+MC_SIMULATIONS = [1000, 10000]
+MC_METHODS = ['plain', 'sobol']
+EXPIRY_DAYS = [1, 7, 14, 30, 60, 90, 180, 270, 365]
+INDEX = 40000
+INTEREST_RATE = 6
+RESULTS_PATH = os.path.join(os.path.dirname(__file__), 'results')
+
+
+# --------------------------------
+# Synthetic chains
+# --------------------------------
+def get_chain(size, index=INDEX, coin='BTC', seed=0):
+    # A Deribit-shaped chain of about size options: calls and puts on a strike
+    # grid around the index for each expiry, quoted in coin off a smile
+    rng = np.random.default_rng(seed)
+    now = dt.datetime.now().replace(hour=8, minute=0, second=0, microsecond=0)
+    strikes_per_expiry = max(size // (2 * len(EXPIRY_DAYS)), 1)
+    rows = []
+    for days in EXPIRY_DAYS:
+        expiration = now + dt.timedelta(days=days)
+        spread = 0.1 + 0.5 * np.sqrt(days / 365)
+        strikes = np.unique(np.round(index * np.exp(np.linspace(-spread, spread, strikes_per_expiry))))
+        for strike in strikes:
+            for flag in ['C', 'P']:
+                rows.append({
+                    'instrument_name': '{}-{}-{}-{}'.format(coin, expiration.strftime('%d%b%y').upper(), int(strike), flag),
+                    'kind': 'option',
+                    'base_currency': coin,
+                    'strike': float(strike),
+                    'expiration_timestamp': int(expiration.timestamp() * 1000),
+                    'until_expiry': days / 365.2425,
+                })
+    markets = pd.DataFrame(rows)
+    moneyness = np.log(markets['strike'] / index)
+    vol = 0.6 + 0.8 * moneyness ** 2 - 0.1 * moneyness
+    mid = pricing.black_scholes_array(
+        index, markets['strike'].values, markets['until_expiry'].values, vol.values, INTEREST_RATE / 100,
+        markets['instrument_name'].str[-1].values
+    ) / index
+    half_spread = np.maximum(mid * 0.02, 0.0005) * rng.uniform(0.5, 1.5, len(markets))
+    tickers = pd.DataFrame({
+        'instrument_name': markets['instrument_name'],
+        'mid_price': mid,
+        'bid_price': np.where(mid - half_spread > 0, mid - half_spread, np.nan),
+        'ask_price': mid + half_spread,
+        'open_interest': rng.integers(0, 1000, len(markets)).astype(float),
+        'index_price': float(index),
+    })
+    return markets.drop(columns='until_expiry'), tickers
+
+
+# --------------------------------
+# Benchmarks
+# --------------------------------
+def bench_black_scholes(markets, tickers):
+    flags = markets['instrument_name'].str[-1].str.lower().tolist()
+    expiry = (markets['expiration_timestamp'].values / 1000 - time.time()) / 31556952
+    strikes = markets['strike'].tolist()
+    return lambda: [
+        pricing.black_scholes(INDEX, k, t, 0.6, INTEREST_RATE / 100, flag) for k, t, flag in zip(strikes, expiry, flags)
+    ]
+
+
+def bench_black_scholes_array(markets, tickers):
+    flags = markets['instrument_name'].str[-1].str.lower().values
+    expiry = (markets['expiration_timestamp'].values / 1000 - time.time()) / 31556952
+    strikes = markets['strike'].values
+    return lambda: pricing.black_scholes_array(INDEX, strikes, expiry, 0.6, INTEREST_RATE / 100, flags)
+
+
+def bench_implied_vol(markets, tickers):
+    flags = markets['instrument_name'].str[-1].str.lower().tolist()
+    expiry = (markets['expiration_timestamp'].values / 1000 - time.time()) / 31556952
+    rows = list(zip((tickers['mid_price'] * INDEX).tolist(), markets['strike'].tolist(), expiry, flags))
+    return lambda: [pricing.get_implied_vol(px, INDEX, k, t, INTEREST_RATE / 100, flag) for px, k, t, flag in rows]
+
+
+def bench_implied_vol_array(markets, tickers):
+    flags = markets['instrument_name'].str[-1].str.lower().values
+    expiry = (markets['expiration_timestamp'].values / 1000 - time.time()) / 31556952
+    prices = tickers['mid_price'].values * INDEX
+    strikes = markets['strike'].values
+    return lambda: pricing.get_implied_vol_array(prices, INDEX, strikes, expiry, INTEREST_RATE / 100, flags)
+
+
+def bench_prepare_options(markets, tickers):
+    return lambda: functions.prepare_options(markets.copy(), tickers, [], INTEREST_RATE)
+
+
+def bench_prepare_options_incremental(markets, tickers):
+    # Second pass over an unchanged chain, re-using the previous IVs
+    previous = functions.prepare_options(markets.copy(), tickers, [], INTEREST_RATE)
+    return lambda: functions.prepare_options(markets.copy(), tickers, [], INTEREST_RATE, previous)
+
+
+def bench_build_vol_surface(markets, tickers):
+    options = functions.prepare_options(markets.copy(), tickers, [], INTEREST_RATE)
+    return lambda: functions.build_vol_surface(options.copy(), 'mid')
+
+
+def bench_price_batch(markets, tickers):
+    # Reprice the whole chain off a vol grid fitted to it
+    options = functions.prepare_options(markets.copy(), tickers, [], INTEREST_RATE)
+    fits = calibration.calibrate(options[options['flag'] == 'c'], 'mid')
+    surface = grid.build(fits, INDEX, INTEREST_RATE / 100)
+    expirations = pd.to_datetime(markets['expiration_timestamp'], unit='ms')
+    flags = markets['instrument_name'].str[-1]
+    return lambda: functions.price_batch(markets['strike'], expirations, flags, INTEREST_RATE / 100, surface)
+
+
+def bench_build_tree(steps, american):
+    # The compute half of apps.binomial.build_tree: price plus exported nodes
+    export_steps, max_nodes = lattice.get_level_of_detail(steps, 2500)
+
+    def run():
+        _, _, nodes = lattice.price(
+            INDEX, INDEX, 30 / 365.2425, 0.6, INTEREST_RATE / 100, 'c', steps, export_steps, max_nodes,
+            american=american
+        )
+        return lattice.get_node_arrays(nodes)
+    return run
+
+
+def bench_monte_carlo(sims, method):
+    expiration = int((time.time() + 30 * 24 * 60 * 60) * 1000)
+    return lambda: functions.get_monte_carlo_simulations(
+        INDEX, INTEREST_RATE / 100, 0.6, expiration, 'c', INDEX, sims, method=method, seed=0, workers=1
+    )
+
+
+def get_cases():
+    # (name, parameters, benchmark factory); factories build their inputs lazily
+    cases = []
+    for size in SCALAR_SIZES:
+        cases.append(('black_scholes', {'chain': size}, lambda size=size: bench_black_scholes(*get_chain(size))))
+        cases.append(('get_implied_vol', {'chain': size}, lambda size=size: bench_implied_vol(*get_chain(size))))
+    for size in CHAIN_SIZES:
+        for name, factory in [
+            ('black_scholes_array', bench_black_scholes_array),
+            ('get_implied_vol_array', bench_implied_vol_array),
+            ('prepare_options', bench_prepare_options),
+            ('prepare_options_incremental', bench_prepare_options_incremental),
+            ('build_vol_surface', bench_build_vol_surface),
+            ('price_batch', bench_price_batch),
+        ]:
+            cases.append((name, {'chain': size}, lambda size=size, factory=factory: factory(*get_chain(size))))
+    for steps in TREE_STEPS:
+        for american in [False, True]:
+            cases.append((
+                'build_tree', {'steps': steps, 'exercise': 'american' if american else 'european'},
+                lambda steps=steps, american=american: bench_build_tree(steps, american)
+            ))
+    for sims in MC_SIMULATIONS:
+        for method in MC_METHODS:
+            cases.append((
+                'get_monte_carlo_simulations', {'sims': sims, 'method': method},
+                lambda sims=sims, method=method: bench_monte_carlo(sims, method)
+            ))
+    return cases
+
+
+def get_items(parameters):
+    return parameters.get('chain') or parameters.get('sims') or parameters.get('steps')
+
+
+def measure(function, repeat, warmup=1):
+    for _ in range(warmup):
+        function()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return np.array(times)
+
+
+def run(repeat, match=None):
+    results = []
+    for name, parameters, factory in get_cases():
+        if match and match not in name:
+            continue
+        times = measure(factory(), repeat)
+        items = get_items(parameters)
+        result = {
+            'name': name,
+            'parameters': parameters,
+            'items': items,
+            'repeat': repeat,
+            'min': times.min(),
+            'median': float(np.median(times)),
+            'mean': times.mean(),
+            'throughput': items / float(np.median(times)),
+        }
+        results.append(result)
+        print('{:<30} {:<40} median {:>10.3f} ms  {:>14,.0f} items/s'.format(
+            name, json.dumps(parameters), 1000 * result['median'], result['throughput']
+        ))
+    return results
+
+
+# --------------------------------
+# Results
+# --------------------------------
+def get_commit():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+        dirty = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], text=True).strip()
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def save(results, path=None):
+    commit = get_commit()
+    path = path or os.path.join(RESULTS_PATH, '{}.json'.format(commit))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as results_file:
+        json.dump({
+            'commit': commit,
+            'timestamp': dt.datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'machine': platform.platform(),
+            'results': results,
+        }, results_file, indent=2, default=float)
+    return path
+
+
+def get_key(result):
+    return result['name'], json.dumps(result['parameters'], sort_keys=True)
+
+
+def compare(baseline, current):
+    # Ratio of median times: above 1 is a speedup of current over baseline
+    with open(baseline) as baseline_file, open(current) as current_file:
+        baseline, current = json.load(baseline_file), json.load(current_file)
+    previous = {get_key(result): result for result in baseline['results']}
+    print('{} -> {}'.format(baseline['commit'], current['commit']))
+    for result in current['results']:
+        before = previous.get(get_key(result))
+        if before is None:
+            continue
+        print('{:<30} {:<40} {:>10.3f} ms -> {:>10.3f} ms  x{:.2f}'.format(
+            result['name'], get_key(result)[1], 1000 * before['median'], 1000 * result['median'],
+            before['median'] / result['median']
+        ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the pricing and analytics hot paths')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--match', help='only run benchmarks whose name contains this')
+    parser.add_argument('--output', help='results file, defaults to benchmarks/results/<commit>.json')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), help='compare two results files')
+    args = parser.parse_args()
+    if args.compare:
+        compare(*args.compare)
+        sys.exit()
+    print('Saved {}'.format(save(run(args.repeat, args.match), args.output)))
@@ -8,9 +8,66 @@ IV_COLUMNS = [
 ]
 IV_SIDES = ['mid', 'bids', 'asks']
 IV_CPS = ['c', 'p']
+SMILE_MODELS = ['svi', 'sabr']
+CALIBRATION_WORKERS = 4
+GRID_MONEYNESS_WIDTH = 1.5
+GRID_POINTS = 301
+GRID_INTERPOLATION = 'linear'
 LIMITS = [0.1, 0.2, 0.3, 0.4, 0.5]
 PRICER_COLUMNS = [
-    'expiry', 'strike', 'index', 'option', 'iv', 'interest', 'price'
+    'expiry', 'strike', 'index', 'option', 'quantity', 'iv', 'interest', 'price',
+    'delta', 'gamma', 'vega', 'theta', 'rho', 'vanna', 'volga'
 ]
-STEPS = [i for i in range(0, 51, 5)]
+PORTFOLIO_COLUMNS = ['expiry', 'bucket', 'quantity', 'delta', 'gamma', 'vega', 'theta', 'rho', 'vanna', 'volga']
+GREEK_MONEYNESS_BUCKETS = [0, 0.8, 0.9, 0.95, 1.05, 1.1, 1.2, float('inf')]
+STEPS = [i for i in range(5, 51, 5)] + [100, 250, 500, 1000, 2500, 5000]
+TREE_MAX_POINTS = 2500
+TREE_LABEL_POINTS = 300
+TREE_EXERCISES = ['european', 'american']
+TREE_CONVERGENCE = ['smoothing', 'richardson']
 SIMULATIONS = [i for i in range(100, 5000, 100)]
+MC_METHODS = ['plain', 'antithetic', 'control', 'moment', 'sobol']
+MC_MAX_SIMULATIONS = 100000
+MC_CHART_MODES = ['fan', 'paths']
+MC_SAMPLE_PATHS = 10
+
+CACHE_TTLS = {'markets': 300, 'tickers': 5, 'index': 2, 'ticker': 2}
+CACHE_REFRESH_AHEAD = 0.8
+CLIENT_POOL_SIZE = 20
+CLIENT_KEEPALIVE = 60
+
+DATA_SOURCE = 'live'
+STORE_PATH = 'data/store'
+STORE_RECORD = False
+STORE_RECORD_INTERVAL = 1
+REPLAY_SPEED = 1
+REPLAY_START = None
+
+METRICS_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+METRICS_BYTE_BUCKETS = [1e3, 1e4, 1e5, 1e6, 1e7]
+PROFILE_CALLBACKS = {}
+PROFILE_PATH = 'data/profiles'
+PROFILE_ROUTE = False
+
+FRAME_STORE_SIZE = 32
+FRAME_STORE_PATH = None
+FRAME_STORE_FILES = 256
+
+SNAPSHOT_INTERVAL = 10
+SNAPSHOT_TIMEOUT = 30
+SNAPSHOT_INTEREST_RATES = [6]
+
+IV_PRICE_TOLERANCE = 1e-6
+IV_INDEX_TOLERANCE = 5e-5
+IV_EXPIRY_TOLERANCE = 1e-3
+
+STREAM_URL = 'wss://www.deribit.com/ws/api/v2'
+STREAM_MOCK_URL = 'ws://localhost:8765'
+STREAM_IV_INTERVAL = 0.5
+STREAM_RECONNECT = 5
+
+MOCK_INDEXES = {'BTC': 40000, 'ETH': 2500}
+MOCK_VOL = 0.6
+MOCK_SPREAD = 0.02
+MOCK_INTERVAL = 0.1
+MOCK_QUOTE_PROBABILITY = 0.2
@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+from scipy.optimize import least_squares
+
+from resources import pool
+
+
+SVI_PARAMETERS = ['a', 'b', 'rho', 'm', 'sigma']
+SABR_PARAMETERS = ['alpha', 'rho', 'nu']
+PARAMETERS = {'svi': SVI_PARAMETERS, 'sabr': SABR_PARAMETERS}
+
+
+def svi_total_variance(params, k):
+    a, b, rho, m, sigma = params
+    return a + b * (rho * (k - m) + np.sqrt((k - m) ** 2 + sigma ** 2))
+
+
+def svi_jacobian(params, k):
+    a, b, rho, m, sigma = params
+    d = k - m
+    root = np.sqrt(d ** 2 + sigma ** 2)
+    return np.column_stack([
+        np.ones_like(k),
+        rho * d + root,
+        b * d,
+        -1 * b * (rho + d / root),
+        b * sigma / root,
+    ])
+
+
+def sabr_vol(params, k, expiry):
+    # Hagan's lognormal expansion with beta = 1, on log-moneyness k = ln(K/F)
+    alpha, rho, nu = params
+    z = -1 * nu / alpha * k
+    x = np.log((np.sqrt(1 - 2 * rho * z + z * z) + z - rho) / (1 - rho))
+    ratio = np.where(np.abs(z) < 1e-8, 1, z / np.where(x == 0, 1, x))
+    return alpha * ratio * (1 + (rho * nu * alpha / 4 + (2 - 3 * rho * rho) * nu * nu / 24) * expiry)
+
+
+def fit_svi(k, w):
+    # Start at a flat smile through the lowest total variance, clipped into the
+    # bounds since narrow, steep smiles push a below -max(w)
+    b = max((w.max() - w.min()) / max(np.abs(k).max(), 1e-4), 1e-3)
+    lower = np.array([-1 * w.max(), 0, -0.999, k.min() - 1, 1e-4])
+    upper = np.array([w.max(), np.inf, 0.999, k.max() + 1, 10])
+    initial = np.clip([w.min() - b * 0.1, b, 0.0, 0.0, 0.1], lower, upper)
+    result = least_squares(
+        lambda params: svi_total_variance(params, k) - w,
+        initial,
+        jac=lambda params: svi_jacobian(params, k),
+        bounds=(lower, upper)
+    )
+    return result.x
+
+
+def fit_sabr(k, vol, expiry):
+    atm = np.clip(vol[np.argmin(np.abs(k))], 1e-4, 10)
+    result = least_squares(
+        lambda params: sabr_vol(params, k, expiry) - vol,
+        [atm, 0.0, 1.0],
+        bounds=([1e-4, -0.999, 1e-4], [10, 0.999, 20])
+    )
+    return result.x
+
+
+def calibrate_expiry(task):
+    model, k, vol, expiry = task
+    # A failed fit only loses its own expiry: the NaN row is dropped downstream
+    if len(k) < len(PARAMETERS[model]):
+        return np.full(len(PARAMETERS[model]), np.nan)
+    try:
+        if model == 'svi':
+            return fit_svi(k, vol * vol * expiry)
+        return fit_sabr(k, vol, expiry)
+    except Exception as e:
+        print(e)
+        return np.full(len(PARAMETERS[model]), np.nan)
+
+
+def run_calibrations(tasks, workers):
+    if workers <= 1 or len(tasks) <= 1:
+        return [calibrate_expiry(task) for task in tasks]
+    return list(pool.get_executor(workers).map(calibrate_expiry, tasks))
+
+
+def calibrate(options, side, model='svi', workers=1):
+    # One smile per expiry, fitted independently (and in parallel) on
+    # log-moneyness against the forward; returns one parameter row per expiry
+    options = options[np.isfinite(options['iv_{}'.format(side)]) & (options['iv_{}'.format(side)] > 0)]
+    expirations, tasks, rows = [], [], []
+    for expiration, group in options.groupby(options['expiration_timestamp'].dt.strftime('%Y-%m-%d')):
+        expiry = group['until_expiry'].mean()
+        forward = group['index'].iloc[0] * np.exp(group['interest_rate'].iloc[0] * expiry)
+        k = np.log(group['strike'].values / forward)
+        tasks.append((model, k, group['iv_{}'.format(side)].values / 100, expiry))
+        expirations.append(expiration)
+        rows.append({'expiry': expiry, 'forward': forward})
+    for row, task, params in zip(rows, tasks, run_calibrations(tasks, workers)):
+        row.update(zip(PARAMETERS[model], params))
+        row['rmse'] = np.sqrt(np.mean((get_model_vol(model, row, task[1]) - task[2]) ** 2)) * 100
+    return pd.DataFrame(rows, index=pd.Index(expirations, name='expiration'), columns=(
+        ['expiry', 'forward'] + PARAMETERS[model] + ['rmse']
+    )).assign(model=model)
+
+
+def get_model_vol(model, row, k):
+    params = [row[name] for name in PARAMETERS[model]]
+    if model == 'svi':
+        return np.sqrt(np.maximum(svi_total_variance(params, k), 0) / row['expiry'])
+    return sabr_vol(params, k, row['expiry'])
+
+
+def get_vol(fits, expiration, strikes):
+    # IV in percent off a fitted smile; NaN for an expiry that was not fitted
+    if expiration not in fits.index:
+        return np.full(np.shape(strikes), np.nan)
+    row = fits.loc[expiration]
+    k = np.log(np.asarray(strikes, dtype=float) / row['forward'])
+    return 100 * get_model_vol(row['model'], row, k)
@@ -0,0 +1,86 @@
+import asyncio
+import threading
+
+import aiohttp
+import pandas as pd
+import ccxt.async_support as ccxt_async
+
+import config
+
+
+loop = None
+exchange = None
+client_lock = threading.Lock()
+
+
+def get_loop():
+    # One long-lived event loop in a daemon thread, so the pooled keep-alive
+    # session outlives individual callbacks
+    global loop
+    with client_lock:
+        if loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+
+def run(coroutine):
+    return asyncio.run_coroutine_threadsafe(coroutine, get_loop()).result()
+
+
+async def get_exchange():
+    global exchange
+    if exchange is None:
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=config.CLIENT_POOL_SIZE, keepalive_timeout=config.CLIENT_KEEPALIVE)
+        )
+        exchange = ccxt_async.deribit({'session': session})
+    return exchange
+
+
+async def fetch_markets():
+    exchange = await get_exchange()
+    return pd.DataFrame(
+        [each_dict['info'] for each_dict in await exchange.fetch_markets()]
+    )
+
+
+async def fetch_tickers(coin):
+    exchange = await get_exchange()
+    tickers = await exchange.fetch_tickers(params={'currency': coin.upper()})
+    return pd.DataFrame(
+        [value['info'] for _, value in tickers.items()]
+    )
+
+
+async def fetch_index(coin):
+    exchange = await get_exchange()
+    index = await exchange.public_get_get_index(params={'currency': coin.upper()})
+    return index['result'][coin.upper()]
+
+
+async def fetch_ticker(instrument_name):
+    exchange = await get_exchange()
+    ticker = await exchange.public_get_ticker(params={'instrument_name': instrument_name})
+    return ticker['result']
+
+
+FETCHERS = {
+    'markets': fetch_markets,
+    'tickers': fetch_tickers,
+    'index': fetch_index,
+    'ticker': fetch_ticker,
+}
+
+
+def fetch(key):
+    return FETCHERS[key[0]](*key[1:])
+
+
+async def gather(keys):
+    return await asyncio.gather(*[fetch(key) for key in keys], return_exceptions=True)
+
+
+def fetch_many(keys):
+    # Independent endpoints go out concurrently on the shared session
+    return run(gather(keys))
@@ -0,0 +1,93 @@
+import os
+import re
+import glob
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+from dash.exceptions import PreventUpdate
+
+import config
+from resources import functions
+
+
+LOADERS = {
+    'markets': lambda coin: functions.get_markets(coin, ['option']),
+}
+# Only scalar identifying columns are hashed: exchange records can carry
+# list or dict fields (e.g. tick_size_steps) that hash_pandas_object rejects
+KEY_COLUMNS = {
+    'markets': ['instrument_name', 'strike', 'expiration_timestamp'],
+}
+# kind:argument...:sha1 digest, as built by put
+KEY_PATTERN = re.compile(r'([a-z]+)(:[A-Za-z0-9]+)*:[0-9a-f]{40}')
+
+frames = OrderedDict()
+frames_lock = threading.Lock()
+
+
+def remember(key, frame):
+    with frames_lock:
+        frames[key] = frame
+        frames.move_to_end(key)
+        while len(frames) > config.FRAME_STORE_SIZE:
+            frames.popitem(last=False)
+
+
+def get_path(key):
+    return os.path.join(config.FRAME_STORE_PATH, '{}.pkl'.format(key.replace(':', '_')))
+
+
+def is_valid(key):
+    # Keys come back from the browser, so nothing else may reach the disk or
+    # the loaders: a crafted key could otherwise point read_pickle anywhere
+    match = KEY_PATTERN.fullmatch(key) if isinstance(key, str) else None
+    return match is not None and match.group(1) in LOADERS
+
+
+def prune():
+    # Frames on disk are only a cache of what the loaders rebuild, so the
+    # oldest files beyond config.FRAME_STORE_FILES are simply dropped
+    try:
+        paths = sorted(glob.glob(os.path.join(config.FRAME_STORE_PATH, '*.pkl')), key=os.path.getmtime, reverse=True)
+    except OSError:
+        # Another worker pruned a file mid-listing; the next put prunes again
+        return
+    for path in paths[config.FRAME_STORE_FILES:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def put(frame, kind, *args):
+    # The browser only carries the returned key; the frame stays in process
+    # memory and, with config.FRAME_STORE_PATH set, on disk for other workers
+    key = ':'.join([kind] + list(args) + [functions.get_digest(frame[KEY_COLUMNS[kind]])])
+    remember(key, frame)
+    if config.FRAME_STORE_PATH and not os.path.exists(get_path(key)):
+        os.makedirs(config.FRAME_STORE_PATH, exist_ok=True)
+        temporary = '{}.{}'.format(get_path(key), os.getpid())
+        frame.to_pickle(temporary)
+        os.replace(temporary, get_path(key))
+        prune()
+    return key
+
+
+def get(key):
+    # Frames are shared between callbacks and must be treated as read-only.
+    # A key evicted everywhere is rebuilt from its kind and arguments
+    if not is_valid(key):
+        raise PreventUpdate
+    with frames_lock:
+        frame = frames.get(key)
+        if frame is not None:
+            frames.move_to_end(key)
+            return frame
+    if config.FRAME_STORE_PATH and os.path.exists(get_path(key)):
+        frame = pd.read_pickle(get_path(key))
+    else:
+        kind, *args, _ = key.split(':')
+        frame = LOADERS[kind](*args)
+    remember(key, frame)
+    return frame
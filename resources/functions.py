@@ -1,15 +1,86 @@
-import ccxt
-import random
+import time
+import hashlib
+import threading
 import numpy as np
 import pandas as pd
 import datetime as dt
-from math import exp, sqrt
+from concurrent.futures import Future
 from py_vollib.black_scholes_merton.implied_volatility import implied_volatility
 
-from resources import pricing
+import config
+from resources import pricing, montecarlo, lattice, client, store, metrics, grid
 
 
-dbt = ccxt.deribit()
+GREEK_DECIMALS = {greek: 8 if greek == 'gamma' else 4 for greek in pricing.GREEKS}
+
+cache = {}
+cache_in_flight = {}
+cache_lock = threading.Lock()
+
+
+def run_fetches(keys, futures):
+    # Every key goes out concurrently through the async client, or is read
+    # from the recorded store when replaying
+    source = store if config.DATA_SOURCE == 'replay' else client
+    try:
+        results = source.fetch_many(keys)
+    except Exception as error:
+        results = [error] * len(keys)
+    for key, future, result in zip(keys, futures, results):
+        with cache_lock:
+            if not isinstance(result, Exception):
+                cache[key] = (result, time.monotonic())
+            cache_in_flight.pop(key, None)
+        if isinstance(result, Exception):
+            future.set_exception(result)
+        else:
+            future.set_result(result)
+            if config.STORE_RECORD and source is client:
+                try:
+                    store.record(key, result)
+                except Exception as e:
+                    print(e)
+
+
+def get_cached(key):
+    # Serve from memory while fresh, refresh in the background once an entry
+    # is past config.CACHE_REFRESH_AHEAD of its TTL, and let concurrent
+    # misses on the same key wait on one in-flight fetch
+    ttl = config.CACHE_TTLS[key[0]]
+    with cache_lock:
+        entry = cache.get(key)
+        if entry is not None:
+            value, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            if age < ttl:
+                if age > ttl * config.CACHE_REFRESH_AHEAD and key not in cache_in_flight:
+                    future = cache_in_flight[key] = Future()
+                    threading.Thread(target=run_fetches, args=([key], [future]), daemon=True).start()
+                return value
+        future = cache_in_flight.get(key)
+        owner = future is None
+        if owner:
+            future = cache_in_flight[key] = Future()
+    with metrics.stage('fetch'):
+        if owner:
+            run_fetches([key], [future])
+        return future.result()
+
+
+def prefetch(keys):
+    # Claim every missing or soon-stale key and fetch them all in one round-trip
+    now = time.monotonic()
+    with cache_lock:
+        keys = [
+            key for key in dict.fromkeys(keys)
+            if key not in cache_in_flight and (
+                key not in cache or now - cache[key][1] >= config.CACHE_TTLS[key[0]] * config.CACHE_REFRESH_AHEAD
+            )
+        ]
+        futures = [cache_in_flight.setdefault(key, Future()) for key in keys]
+    if keys:
+        with metrics.stage('fetch'):
+            run_fetches(keys, futures)
 
 
 def get_iv(row, side):
@@ -30,51 +101,80 @@ def get_iv(row, side):
     return iv
 
 
-def get_iv_custom(row, side):
-    try:
-        if not np.isnan(row['mid_price']):
-            iv = pricing.get_implied_vol(
-                row['{}_price'.format(side)] * row['index_price'],
-                row['index_price'],
-                row['strike'],
-                row['until_expiry'],
-                row['interest_rate'],
-                row['flag']
-            )
-            iv = round(100 * iv, 2)
-        else:
-            iv = np.nan
-    except Exception as e:
-        print(e)
-        iv = np.nan
-    return iv
+def get_solve_columns(column):
+    # Where the inputs an IV column was last solved at are carried forward
+    return ['{}_solved_{}'.format(column, each) for each in ['price', 'index', 'expiry']]
+
+
+def get_iv_changes(options, previous, side, column):
+    # Tolerances are measured against the inputs each IV was last solved at,
+    # not the previous chain's, so small moves cannot pile up unnoticed
+    price, index, expiry = [previous[each].values for each in get_solve_columns(column)]
+    unchanged = (
+        np.isclose(options['{}_price'.format(side)].values, price,
+                   rtol=0, atol=config.IV_PRICE_TOLERANCE, equal_nan=True)
+        & np.isclose(options['index_price'].values, index, rtol=config.IV_INDEX_TOLERANCE, atol=0)
+        & np.isclose(options['until_expiry'].values, expiry, rtol=config.IV_EXPIRY_TOLERANCE, atol=0)
+        & (options['interest_rate'].values == previous['interest_rate'].values)
+    )
+    return ~unchanged
+
+
+def get_iv_custom(options, side, previous=None):
+    # With a previous chain, only rows whose inputs moved beyond tolerance are
+    # re-solved, warm-started from their previous IV. Returns the IVs and the
+    # inputs each was solved at
+    column = {'mid': 'iv_mid', 'bid': 'iv_bids', 'ask': 'iv_asks'}[side]
+    iv = np.full(len(options), np.nan)
+    solve = np.ones(len(options), dtype=bool)
+    initial_vol = None
+    inputs = np.column_stack([
+        options['{}_price'.format(side)].values, options['index_price'].values, options['until_expiry'].values
+    ]).astype(float)
+    if previous is not None:
+        previous = previous.reindex(options['instrument_name'])
+        iv = previous[column].values.astype(float)
+        solve = get_iv_changes(options, previous, side, column)
+        initial_vol = iv[solve] / 100
+        inputs[~solve] = previous[get_solve_columns(column)].values[~solve]
+    iv[solve] = np.round(100 * pricing.get_implied_vol_array(
+        options['{}_price'.format(side)].values[solve] * options['index_price'].values[solve],
+        options['index_price'].values[solve],
+        options['strike'].values[solve],
+        options['until_expiry'].values[solve],
+        options['interest_rate'].values[solve],
+        options['flag'].values[solve],
+        initial_vol=initial_vol
+    ), 2)
+    iv[options['mid_price'].isna().values] = np.nan
+    return iv, inputs
+
+
+def get_digest(frame):
+    return hashlib.sha1(pd.util.hash_pandas_object(frame, index=False).values.tobytes()).hexdigest()
 
 
 def get_index(coin):
-    index = dbt.public_get_get_index(params={'currency': coin.upper()})['result'][coin.upper()]
+    index = get_cached(('index', coin.upper()))
     return index
 
 
 def get_markets(coin, kind):
-    markets = pd.DataFrame(
-        [each_dict['info'] for each_dict in dbt.fetch_markets()]
-    )
-    markets = markets[(markets['kind'].isin(kind)) & (markets['base_currency'] == coin.upper())]
+    markets = get_cached(('markets',))
+    markets = markets[(markets['kind'].isin(kind)) & (markets['base_currency'] == coin.upper())].copy()
     markets['expiration_timestamp'] = pd.to_datetime(markets['expiration_timestamp'], unit='ms')
     markets.sort_values('expiration_timestamp', ascending=True, inplace=True)
     return markets
 
 
 def get_tickers(coin):
-    tickers = pd.DataFrame(
-        [value['info'] for _, value in dbt.fetch_tickers(params={'currency': coin.upper()}).items()]
-    )
-    index = dbt.public_get_get_index(params={'currency': coin.upper()})['result'][coin.upper()]
-    tickers['index_price'] = index
+    prefetch([('tickers', coin.upper()), ('index', coin.upper())])
+    tickers = get_cached(('tickers', coin.upper())).copy()
+    tickers['index_price'] = get_index(coin)
     return tickers
 
 
-def prepare_options(markets, tickers, maturity, interest_rate):
+def prepare_options(markets, tickers, maturity, interest_rate, previous=None):
 
     markets['expiration_timestamp'] = pd.to_datetime(markets['expiration_timestamp'], unit='ms')
     if maturity:
@@ -92,9 +192,10 @@ def prepare_options(markets, tickers, maturity, interest_rate):
     option_tickers['until_expiry'] = (option_tickers['expiration_timestamp'] - dt.datetime.now()).dt.total_seconds() / 31556952
     option_tickers['interest_rate'] = interest_rate / 100
     option_tickers['q'] = 0
-    option_tickers['iv_mid'] = option_tickers.apply(lambda row: get_iv_custom(row, 'mid'), axis=1)
-    option_tickers['iv_bids'] = option_tickers.apply(lambda row: get_iv_custom(row, 'bid'), axis=1)
-    option_tickers['iv_asks'] = option_tickers.apply(lambda row: get_iv_custom(row, 'ask'), axis=1)
+    if previous is not None:
+        previous = previous.drop_duplicates('instrument_name').set_index('instrument_name')
+    for side, column in [('mid', 'iv_mid'), ('bid', 'iv_bids'), ('ask', 'iv_asks')]:
+        option_tickers[column], option_tickers[get_solve_columns(column)] = get_iv_custom(option_tickers, side, previous)
     option_tickers.rename(
         columns={'index_price': 'index', 'bid_price': 'bid', 'ask_price': 'ask', 'open_interest': 'interest'},
         inplace=True
@@ -103,112 +204,112 @@ def prepare_options(markets, tickers, maturity, interest_rate):
 
 
 def build_vol_surface(options, side):
-    options['expiration'] = options['expiration_timestamp'].dt.strftime('%Y-%m-%d')
-    surface = pd.pivot_table(
-        options,
-        index=['expiration'],
-        columns=['strike'],
-        values=['iv_{}'.format(side)]
-    )
-    surface = surface.droplevel(0, axis=1).reset_index()
-    surface.sort_values('expiration', ascending=True, inplace=True)
+    with metrics.stage('pivot'):
+        options['expiration'] = options['expiration_timestamp'].dt.strftime('%Y-%m-%d')
+        surface = pd.pivot_table(
+            options,
+            index=['expiration'],
+            columns=['strike'],
+            values=['iv_{}'.format(side)]
+        )
+        surface = surface.droplevel(0, axis=1).reset_index()
+        surface.sort_values('expiration', ascending=True, inplace=True)
     return surface
 
 
-def price_options(pricer_table, coin, interest_rate, fit_model):
-    index = get_index(coin)
-    for each_dict in pricer_table:
-        each_dict['index'] = index
-        strike = float(each_dict['strike'])
-        flag = each_dict['option']
-        until_expiry = (pd.to_datetime(each_dict['expiry'], format='%Y-%m-%d %H:%M:%S') - dt.datetime.now()).total_seconds() / 31556952
-        v = fit_model([float(strike)])[0] / 100
-        each_dict['iv'] = round(v, 2)
-        try:
-            price = pricing.black_scholes(index, strike, until_expiry, v, interest_rate, flag)
-        except:
-            price = np.nan
-        each_dict['price'] = round(price / index, 4)
+def price_batch(strikes, expirations, flags, interest_rate, surface, index=None):
+    # Columnar pricing off a vol grid: one datetime parse, one vol lookup and
+    # one Black-Scholes call per batch. The index defaults to the one the grid
+    # was built at, so nothing is fetched
+    index = surface['index'] if index is None else index
+    strikes = pd.to_numeric(pd.Series(strikes, dtype=object), errors='coerce').values.astype(float)
+    flags = pd.Series(flags, dtype=object).fillna('').astype(str).str.lower().values
+    until_expiry = (
+        pd.to_datetime(pd.Series(expirations, dtype=object), errors='coerce') - dt.datetime.now()
+    ).dt.total_seconds().values / 31556952
+    vol = grid.get_vol(surface, strikes, until_expiry, config.GRID_INTERPOLATION) / 100
+    valid = np.isin(flags, ['c', 'p'])
+    price = pricing.black_scholes_array(index, strikes, until_expiry, vol, interest_rate, flags)
+    greeks = pricing.get_greeks_array(index, strikes, until_expiry, vol, interest_rate, flags)
+    return pd.DataFrame(dict({
+        'strike': strikes,
+        'until_expiry': until_expiry,
+        'flag': flags,
+        'index': index,
+        'iv': vol,
+        'price': np.where(valid, price, np.nan),
+    }, **{greek: np.where(valid, value, np.nan) for greek, value in greeks.items()}))
+
+
+def price_options(pricer_table, interest_rate, surface):
+    rows = pd.DataFrame(pricer_table).reindex(columns=['expiry', 'strike', 'option'])
+    prices = price_batch(rows['strike'], rows['expiry'], rows['option'], interest_rate, surface)
+    for each_dict, each_price in zip(pricer_table, prices.to_dict('records')):
+        each_dict['index'] = float(each_price['index'])
+        each_dict['iv'] = round(each_price['iv'], 2)
+        each_dict['price'] = round(each_price['price'] / each_price['index'], 4)
+        each_dict.setdefault('quantity', 1)
+        each_dict.update({greek: round(each_price[greek], GREEK_DECIMALS[greek]) for greek in pricing.GREEKS})
     return pricer_table
 
 
-def get_timestamps(expiration, steps):
-    timestamps = np.linspace(
-        int(dt.datetime.now().timestamp() * 1000),
-        expiration,
-        steps
+def add_greeks(options, side='mid'):
+    # Greeks for a whole prepared chain in one vectorized pass, at its own IVs
+    greeks = pricing.get_greeks_array(
+        options['index'].values, options['strike'].values, options['until_expiry'].values,
+        options['iv_{}'.format(side)].values / 100, options['interest_rate'].values, options['flag'].values
     )
-    delta_t = (expiration - int(dt.datetime.now().timestamp() * 1000)) / steps
-    return timestamps, delta_t / 31556952
+    return options.assign(**greeks)
+
+
+def aggregate_greeks(positions):
+    # Quantity-weighted Greeks summed by expiry and moneyness bucket, plus a total
+    positions = pd.DataFrame(positions).reindex(columns=['expiry', 'strike', 'index', 'quantity'] + pricing.GREEKS)
+    positions = positions[pd.to_numeric(positions['delta'], errors='coerce').notna()].copy()
+    positions['quantity'] = pd.to_numeric(positions['quantity'], errors='coerce').fillna(0)
+    positions['expiry'] = positions['expiry'].astype(str).str[:10]
+    positions['bucket'] = pd.cut(
+        pd.to_numeric(positions['strike'], errors='coerce') / positions['index'],
+        config.GREEK_MONEYNESS_BUCKETS
+    ).astype(str)
+    weighted = positions[pricing.GREEKS].mul(positions['quantity'], axis=0)
+    weighted[['expiry', 'bucket', 'quantity']] = positions[['expiry', 'bucket', 'quantity']]
+    portfolio = weighted.groupby(['expiry', 'bucket'], as_index=False).sum()
+    total = weighted[['quantity'] + pricing.GREEKS].sum().to_frame().T.assign(expiry='Total', bucket='')
+    return pd.concat([portfolio, total], ignore_index=True).round(dict(GREEK_DECIMALS, quantity=4))
+
+
+def get_timestamps(expiration, steps):
+    now = int(dt.datetime.now().timestamp() * 1000)
+    timestamps = np.linspace(now, expiration, steps + 1)
+    delta_t = (expiration - now) / steps
+    return timestamps, delta_t / (31556952 * 1000)
 
 
 def get_ticker(instrument_name):
-    ticker = dbt.public_get_ticker(
-        params={'instrument_name': instrument_name}
-    )['result']
+    ticker = get_cached(('ticker', instrument_name))
     return ticker
 
 
 def get_u_d_p(index, vol, delta_t, interest_rate):
-    u = exp(vol * sqrt(delta_t))
-    d = exp(-1 * vol * sqrt(delta_t))
-    a = exp(interest_rate * delta_t)
-    p = (a - d) / (u - d)
-    return u, d, p
-
-
-def price_function(index, interest_rate, vol, t):
-    epsilon = round(random.uniform(-1, 1), 2)
-    vol_sq = (vol * vol) / 2
-    vol_sq = interest_rate - vol_sq
-    exp_1 = vol_sq * t
-    exp_2 = vol * epsilon * sqrt(t)
-    exp_term = exp_1 + exp_2
-    exp_term = np.exp(exp_term)
-    price = index * exp_term
-    return price
+    return lattice.get_u_d_p(vol, delta_t, interest_rate)
+
 
+def get_monte_carlo_simulations(index, interest_rate, vol, expiration, flag, strike, sims, time_step=60*60*1000,
+                                method='plain', target_error=None, max_sims=None, seed=None, workers=None):
+    now = int(dt.datetime.now().timestamp() * 1000)
+    steps = (expiration - now) / time_step
+    timeseries = np.linspace(now, expiration, max(int(steps), 2))
+    delta_t = np.diff(timeseries) / (31556952 * 1000)
 
-def get_monte_carlo_simulations(index, interest_rate, vol, expiration, flag, strike, sims, time_step=60*60*1000):
-    steps = (expiration - int(dt.datetime.now().timestamp() * 1000)) / (time_step)
-    timeseries = np.linspace(
-        int(dt.datetime.now().timestamp() * 1000),
-        expiration,
-        int(steps)
+    price_series, statistics = montecarlo.simulate(
+        index, interest_rate, vol, delta_t, strike, flag, sims, method, target_error, max_sims, seed, workers
     )
-    timestamps = [i/31556952 for i in timeseries]
-    timestamps = pd.Series(timestamps).diff()
-
-    price_series = []
-    expected_payoffs = []
-    for i in range(sims):
-        print(i)
-        this_sim_prices = []
-        for j in range(len(timestamps)):
-            try:
-                if j == 0:
-                    price = index
-                # elif j == 0:
-                #     price = price_function(index, interest_rate, vol, timestamps[j])
-                else:
-                    last_price = this_sim_prices[-1]
-                    price = price_function(last_price, interest_rate, vol, timestamps[j])
-            except Exception as error:
-                break
-            this_sim_prices.append(price)
-
-        if flag == 'C':
-            payoff = max(this_sim_prices[-1] - strike, 0)
-        else:
-            payoff = max(this_sim_prices[-1] - strike, 0)
-        price_series.append(this_sim_prices)
-        if payoff > 0:
-            expected_payoffs.append(payoff)
 
-    return timeseries, price_series, expected_payoffs
+    return timeseries, price_series, statistics
 
 
 def get_bs_price(index, strike, expiration, vol, interest_rate, flag):
-    expiration = (expiration - int(dt.datetime.now().timestamp() * 1000)) / 31556952
+    expiration = (expiration - int(dt.datetime.now().timestamp() * 1000)) / (31556952 * 1000)
     price = pricing.black_scholes(index, strike, expiration, vol, interest_rate, flag)
     return price
@@ -0,0 +1,62 @@
+import numpy as np
+from scipy.interpolate import CubicSpline
+
+from resources import calibration
+
+
+def build(fits, index, interest_rate, width=1.5, points=301):
+    # Total variance on a dense log-moneyness x expiry grid, sampled once from
+    # the fitted smiles. A zero-variance column at T = 0 anchors the short end,
+    # and total variance is made non-decreasing in T at every moneyness so
+    # interpolating between expiries cannot create calendar arbitrage
+    fits = fits.dropna().sort_values('expiry')
+    k = np.linspace(-1 * width, width, points)
+    w = np.zeros((points, len(fits) + 1))
+    for j, (_, row) in enumerate(fits.iterrows(), 1):
+        w[:, j] = calibration.get_model_vol(row['model'], row, k) ** 2 * row['expiry']
+    w = np.maximum.accumulate(w, axis=1)
+    return {
+        'k': k,
+        'expiry': np.concatenate([[0], fits['expiry'].values]),
+        'w': w,
+        'spline': CubicSpline(k, w, axis=0),
+        'index': index,
+        'interest_rate': interest_rate,
+    }
+
+
+def get_smiles(grid, k, method='linear'):
+    # Total variance at each query moneyness for every grid expiry: (len(k), expiries)
+    k = np.clip(k, grid['k'][0], grid['k'][-1])
+    if method == 'cubic':
+        return grid['spline'](k)
+    position = (k - grid['k'][0]) / (grid['k'][1] - grid['k'][0])
+    i = np.clip(np.nan_to_num(position).astype(int), 0, len(grid['k']) - 2)
+    f = (position - i)[:, None]
+    return (1 - f) * grid['w'][i] + f * grid['w'][i + 1]
+
+
+def get_total_variance(grid, k, expiry, method='linear'):
+    # Linear in total variance between expiries, constant vol beyond the last
+    k, expiry = np.broadcast_arrays(np.asarray(k, dtype=float), np.asarray(expiry, dtype=float))
+    shape = k.shape
+    k, expiry = k.ravel(), expiry.ravel()
+    expiries = grid['expiry']
+    if len(expiries) < 2:
+        return np.full(shape, np.nan)
+    smiles = get_smiles(grid, k, method)
+    rows = np.arange(len(k))
+    j = np.clip(np.searchsorted(expiries, expiry), 1, len(expiries) - 1)
+    alpha = (expiry - expiries[j - 1]) / (expiries[j] - expiries[j - 1])
+    w = (1 - alpha) * smiles[rows, j - 1] + alpha * smiles[rows, j]
+    w = np.where(expiry > expiries[-1], smiles[:, -1] * expiry / expiries[-1], w)
+    return w.reshape(shape)
+
+
+def get_vol(grid, strikes, expiry, method='linear'):
+    # Vectorized vol(K, T) in percent for any strikes and expiries (in years)
+    strikes, expiry = np.broadcast_arrays(np.asarray(strikes, dtype=float), np.asarray(expiry, dtype=float))
+    forward = grid['index'] * np.exp(grid['interest_rate'] * expiry)
+    w = get_total_variance(grid, np.log(strikes / forward), expiry, method)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100 * np.sqrt(np.maximum(w, 0) / expiry)
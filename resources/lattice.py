@@ -0,0 +1,130 @@
+import numpy as np
+
+from resources import pricing
+
+
+def get_u_d_p(vol, delta_t, interest_rate):
+    u = np.exp(vol * np.sqrt(delta_t))
+    d = 1 / u
+    a = np.exp(interest_rate * delta_t)
+    p = (a - d) / (u - d)
+    return u, d, p
+
+
+def get_underlying(index, u, step, nodes=None):
+    # Node j of a step has j up-moves, so it sits at index * u^(2j - step)
+    nodes = np.arange(step + 1) if nodes is None else nodes
+    return index * np.exp(np.log(u) * (2 * nodes - step))
+
+
+def get_export_steps(steps, max_steps):
+    return np.unique(np.linspace(0, steps, min(steps + 1, max_steps)).round().astype(int))
+
+
+def get_export_nodes(step, max_nodes):
+    return np.unique(np.linspace(0, step, min(step + 1, max_nodes)).round().astype(int))
+
+
+def get_level_of_detail(steps, max_points):
+    # Full tree when it fits the point budget, otherwise an even grid of
+    # columns and nodes per column that does
+    if (steps + 1) * (steps + 2) / 2 <= max_points:
+        return np.arange(steps + 1), steps + 1
+    side = max(int(np.sqrt(max_points)), 2)
+    return get_export_steps(steps, side), side
+
+
+def get_node_arrays(nodes):
+    steps = sorted(nodes)
+    return (
+        np.concatenate([np.full(len(nodes[i][0]), i) for i in steps]),
+        np.concatenate([nodes[i][0] for i in steps]),
+        np.concatenate([nodes[i][1] for i in steps])
+    )
+
+
+def get_greeks(index, u, delta_t, value, level_1, level_2):
+    if level_1 is None or level_2 is None:
+        return {'delta': np.nan, 'gamma': np.nan, 'theta': np.nan}
+    s_1 = get_underlying(index, u, 1)
+    s_2 = get_underlying(index, u, 2)
+    delta_up = (level_2[2] - level_2[1]) / (s_2[2] - s_2[1])
+    delta_down = (level_2[1] - level_2[0]) / (s_2[1] - s_2[0])
+    return {
+        'delta': (level_1[1] - level_1[0]) / (s_1[1] - s_1[0]),
+        'gamma': (delta_up - delta_down) / ((s_2[2] - s_2[0]) / 2),
+        # The middle node two steps on is back at the spot
+        'theta': (level_2[1] - value) / (2 * delta_t)
+    }
+
+
+def price(index, strike, expiry, vol, interest_rate, flag, steps, export_steps=None, max_nodes=None,
+          american=False, smoothing=False):
+    delta_t = expiry / steps
+    u, d, p = get_u_d_p(vol, delta_t, interest_rate)
+    discount = np.exp(-1 * interest_rate * delta_t)
+    export_steps = set() if export_steps is None else set(int(i) for i in export_steps)
+    max_nodes = steps + 1 if max_nodes is None else max_nodes
+
+    # Every node price in the lattice; step i is the slice [steps - i:steps + i + 1:2]
+    underlying = index * np.exp(np.log(u) * np.arange(-steps, steps + 1))
+    exercise = pricing.get_payoffs(underlying, strike, flag)
+
+    nodes = {}
+    levels = {}
+
+    def export(step):
+        j = get_export_nodes(step, max_nodes)
+        nodes[step] = (underlying[steps - step + 2 * j], values[j])
+
+    # One array of terminal values, rolled back in place one step at a time
+    values = exercise[::2].copy()
+    if steps in (1, 2):
+        levels[steps] = values.copy()
+    if steps in export_steps:
+        export(steps)
+    first = steps - 1
+    if smoothing and steps > 1:
+        # Broadie-Detemple: the last step is replaced by the Black-Scholes value
+        values = pricing.black_scholes_array(underlying[1:-1:2], strike, delta_t, vol, interest_rate, flag)
+        if american:
+            np.maximum(values, exercise[1:-1:2], out=values)
+        if steps - 1 in (1, 2):
+            levels[steps - 1] = values.copy()
+        if steps - 1 in export_steps:
+            export(steps - 1)
+        first = steps - 2
+
+    for i in range(first, -1, -1):
+        values[:i + 1] = discount * (p * values[1:i + 2] + (1 - p) * values[:i + 1])
+        if american:
+            np.maximum(values[:i + 1], exercise[steps - i:steps + i + 1:2], out=values[:i + 1])
+        if i in (1, 2):
+            levels[i] = values[:i + 1].copy()
+        if i in export_steps:
+            export(i)
+
+    greeks = get_greeks(index, u, delta_t, values[0], levels.get(1), levels.get(2))
+    return values[0], greeks, nodes
+
+
+def price_extrapolated(index, strike, expiry, vol, interest_rate, flag, steps, export_steps=None, max_nodes=None,
+                       american=False, smoothing=False):
+    # Two-point Richardson extrapolation against a tree with half the steps.
+    # Only the smoothed tree (BBSR) converges monotonically in 1/N; the plain
+    # tree oscillates between odd and even N, so smoothing is always applied
+    value, greeks, nodes = price(
+        index, strike, expiry, vol, interest_rate, flag, steps, export_steps, max_nodes, american, smoothing=True
+    )
+    if steps < 4:
+        return value, greeks, nodes
+    half_steps = steps // 2
+    half_value, half_greeks, _ = price(
+        index, strike, expiry, vol, interest_rate, flag, half_steps, None, None, american, smoothing=True
+    )
+
+    def extrapolate(full, half):
+        return (steps * full - half_steps * half) / (steps - half_steps)
+
+    greeks = {key: extrapolate(greeks[key], half_greeks[key]) for key in greeks}
+    return extrapolate(value, half_value), greeks, nodes
@@ -0,0 +1,183 @@
+import os
+import time
+import random
+import bisect
+import cProfile
+import threading
+import functools
+import contextlib
+
+import flask
+from dash.exceptions import PreventUpdate
+
+import config
+
+
+histograms = {}
+counters = {}
+profiling = dict(config.PROFILE_CALLBACKS)
+callbacks = set()
+metrics_lock = threading.Lock()
+local = threading.local()
+
+
+def get_key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def observe(name, labels, value, buckets):
+    with metrics_lock:
+        histogram = histograms.setdefault(
+            get_key(name, labels), {'buckets': buckets, 'counts': [0] * (len(buckets) + 1), 'sum': 0.0}
+        )
+        histogram['counts'][bisect.bisect_left(histogram['buckets'], value)] += 1
+        histogram['sum'] += value
+
+
+def increment(name, labels):
+    with metrics_lock:
+        key = get_key(name, labels)
+        counters[key] = counters.get(key, 0) + 1
+
+
+@contextlib.contextmanager
+def stage(name):
+    # Time spent in a named stage of the running callback; outside a callback,
+    # or nested inside another stage, this is a no-op
+    stages = getattr(local, 'stages', None)
+    if stages is None or local.active:
+        yield
+        return
+    local.active = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages[name] = stages.get(name, 0) + time.perf_counter() - start
+        local.active = False
+
+
+def get_profile_path(name):
+    os.makedirs(config.PROFILE_PATH, exist_ok=True)
+    return os.path.join(config.PROFILE_PATH, '{}-{}.prof'.format(name, int(time.time() * 1000)))
+
+
+def timed(function):
+    name = '{}.{}'.format(function.__module__.split('.')[-1], function.__name__)
+    callbacks.add(name)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        local.stages, local.active = {}, False
+        profiler = cProfile.Profile() if random.random() < profiling.get(name, 0) else None
+        outcome = 'ok'
+        start = time.perf_counter()
+        try:
+            if profiler:
+                profiler.enable()
+            return function(*args, **kwargs)
+        except PreventUpdate:
+            outcome = 'prevented'
+            raise
+        except Exception:
+            outcome = 'error'
+            raise
+        finally:
+            total = time.perf_counter() - start
+            if profiler:
+                profiler.disable()
+                profiler.dump_stats(get_profile_path(name))
+            stages, local.stages = local.stages, None
+            stages['compute'] = max(total - sum(stages.values()), 0)
+            for each, seconds in stages.items():
+                observe('dash_callback_stage_seconds', {'callback': name, 'stage': each}, seconds, config.METRICS_BUCKETS)
+            observe('dash_callback_seconds', {'callback': name}, total, config.METRICS_BUCKETS)
+            increment('dash_callback_calls_total', {'callback': name, 'outcome': outcome})
+            if flask.has_request_context():
+                flask.g.callback_metrics = (name, total, outcome)
+    return wrapper
+
+
+def start_request():
+    flask.g.request_started = time.perf_counter()
+
+
+def record_request(response):
+    # Dash serializes outputs after the callback returns, so whatever the
+    # request took beyond the callback itself is attributed to serialization
+    callback = flask.g.pop('callback_metrics', None)
+    if callback is not None and callback[2] == 'ok':
+        name, total, _ = callback
+        elapsed = time.perf_counter() - flask.g.request_started
+        observe('dash_callback_stage_seconds', {'callback': name, 'stage': 'serialize'}, max(elapsed - total, 0),
+                config.METRICS_BUCKETS)
+        observe('dash_callback_payload_bytes', {'callback': name}, len(response.get_data()),
+                config.METRICS_BYTE_BUCKETS)
+    return response
+
+
+def get_labels(labels, **extra):
+    labels = list(labels) + list(extra.items())
+    return '{' + ','.join('{}="{}"'.format(key, value) for key, value in labels) + '}'
+
+
+def render():
+    # Prometheus text exposition format
+    lines = []
+    with metrics_lock:
+        for name in sorted(set(key[0] for key in histograms)):
+            lines.append('# TYPE {} histogram'.format(name))
+            for (each, labels), histogram in sorted(histograms.items()):
+                if each != name:
+                    continue
+                cumulative = 0
+                for le, count in zip(histogram['buckets'] + ['+Inf'], histogram['counts']):
+                    cumulative += count
+                    lines.append('{}_bucket{} {}'.format(name, get_labels(labels, le=le), cumulative))
+                lines.append('{}_sum{} {}'.format(name, get_labels(labels), histogram['sum']))
+                lines.append('{}_count{} {}'.format(name, get_labels(labels), cumulative))
+        for name in sorted(set(key[0] for key in counters)):
+            lines.append('# TYPE {} counter'.format(name))
+            for (each, labels), count in sorted(counters.items()):
+                if each == name:
+                    lines.append('{}{} {}'.format(name, get_labels(labels), count))
+    return '\n'.join(lines) + '\n'
+
+
+def get_metrics():
+    return flask.Response(render(), mimetype='text/plain; version=0.0.4')
+
+
+def set_profiling():
+    # /profile?callback=skew.get_options&rate=0.1 samples a tenth of that
+    # callback's calls into config.PROFILE_PATH; rate=0 switches it off
+    callback = flask.request.args.get('callback')
+    if callback:
+        if callback not in callbacks:
+            return flask.jsonify({'error': 'unknown callback {}'.format(callback)}), 400
+        try:
+            rate = float(flask.request.args.get('rate', 1))
+        except ValueError:
+            rate = None
+        if rate is None or not 0 <= rate <= 1:
+            return flask.jsonify({'error': 'rate must be a number between 0 and 1'}), 400
+        profiling[callback] = rate
+    return flask.jsonify(profiling)
+
+
+def instrument(app):
+    # Every callback registered through app.callback from here on is timed
+    register = app.callback
+
+    def callback(*args, **kwargs):
+        decorator = register(*args, **kwargs)
+        return lambda function: decorator(timed(function))
+
+    app.callback = callback
+    app.server.before_request(start_request)
+    app.server.after_request(record_request)
+    app.server.add_url_rule('/metrics', 'metrics', get_metrics)
+    # The profiling toggle is unauthenticated and writes to disk, so it is
+    # only served when explicitly enabled, e.g. on a local debug instance
+    if config.PROFILE_ROUTE:
+        app.server.add_url_rule('/profile', 'profile', set_profiling)
@@ -0,0 +1,106 @@
+import sys
+import json
+import time
+import asyncio
+import datetime as dt
+
+import numpy as np
+import websockets
+
+import config
+from resources import pricing
+
+
+def parse_instrument(instrument_name):
+    coin, expiry, strike, flag = instrument_name.split('-')
+    expiration = dt.datetime.strptime(expiry, '%d%b%y').replace(hour=8)
+    return coin, expiration, float(strike), flag.lower()
+
+
+def get_channel_coin(channel):
+    name = channel.split('.')[1]
+    return name.split('_')[0].upper() if channel.startswith('deribit_price_index.') else name.split('-')[0]
+
+
+def get_notification(channel, data):
+    return json.dumps({'jsonrpc': '2.0', 'method': 'subscription', 'params': {'channel': channel, 'data': data}})
+
+
+def get_synthetic_messages(channels, rng, indexes):
+    # A random-walk index per coin and Black-Scholes quotes around it at a
+    # flat vol, with a fixed relative spread
+    messages = []
+    now = int(time.time() * 1000)
+    for coin in indexes:
+        indexes[coin] *= np.exp(config.MOCK_VOL * np.sqrt(config.MOCK_INTERVAL / 31556952) * rng.standard_normal())
+    for channel in channels:
+        if channel.startswith('deribit_price_index.'):
+            coin = get_channel_coin(channel)
+            messages.append(get_notification(
+                channel, {'index_name': '{}_usd'.format(coin.lower()), 'price': indexes[coin], 'timestamp': now}
+            ))
+        elif channel.startswith('ticker.') and rng.random() < config.MOCK_QUOTE_PROBABILITY:
+            instrument_name = channel.split('.')[1]
+            coin, expiration, strike, flag = parse_instrument(instrument_name)
+            index = indexes[coin]
+            until_expiry = max((expiration - dt.datetime.now()).total_seconds() / 31556952, 1e-6)
+            mark = pricing.black_scholes(index, strike, until_expiry, config.MOCK_VOL, 0, flag) / index
+            messages.append(get_notification(channel, {
+                'instrument_name': instrument_name,
+                'best_bid_price': round(mark * (1 - config.MOCK_SPREAD), 4),
+                'best_ask_price': round(mark * (1 + config.MOCK_SPREAD), 4),
+                'best_bid_amount': 1,
+                'best_ask_amount': 1,
+                'mark_price': mark,
+                'index_price': index,
+                'open_interest': 1,
+                'timestamp': now
+            }))
+    return messages
+
+
+def get_replay_messages(replay, channels):
+    channels = set(channels)
+    with open(replay) as replay_file:
+        for line in replay_file:
+            if json.loads(line)['params']['channel'] in channels:
+                yield line.strip()
+
+
+async def publish(websocket, channels, replay=None):
+    if replay:
+        for message in get_replay_messages(replay, channels):
+            await websocket.send(message)
+            await asyncio.sleep(config.MOCK_INTERVAL)
+        return
+    rng = np.random.default_rng()
+    indexes = {coin: config.MOCK_INDEXES[coin] for coin in set(get_channel_coin(channel) for channel in channels)}
+    while True:
+        for message in get_synthetic_messages(channels, rng, indexes):
+            await websocket.send(message)
+        await asyncio.sleep(config.MOCK_INTERVAL)
+
+
+async def handle(websocket, path=None, replay=None):
+    tasks = []
+    try:
+        async for message in websocket:
+            request = json.loads(message)
+            if request.get('method') == 'public/subscribe':
+                channels = request['params']['channels']
+                await websocket.send(json.dumps({'jsonrpc': '2.0', 'id': request.get('id'), 'result': channels}))
+                tasks.append(asyncio.ensure_future(publish(websocket, channels, replay)))
+    except websockets.ConnectionClosed:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def serve(host='localhost', port=8765, replay=None):
+    async with websockets.serve(lambda websocket, *args: handle(websocket, replay=replay), host, port):
+        await asyncio.Future()
+
+
+if __name__ == '__main__':
+    asyncio.run(serve(replay=sys.argv[1] if len(sys.argv) > 1 else None))
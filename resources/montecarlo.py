@@ -0,0 +1,278 @@
+import os
+import warnings
+from collections import deque
+
+import numpy as np
+from scipy.special import ndtri
+from scipy.stats import qmc
+
+from resources import pricing, pool
+
+
+SOBOL_DIMENSIONS = 256
+QMC_REPLICATES = 8
+CHUNK_ELEMENTS = 2 ** 20
+MIN_CHUNK_SIZE = 64
+PATH_RESERVOIR = 500
+PAYOFF_RESERVOIR = 10000
+QUANTILES = [5, 25, 50, 75, 95]
+
+
+def get_log_increments(interest_rate, vol, delta_t, z):
+    drift = (interest_rate - ((vol * vol) / 2)) * delta_t
+    return drift + vol * np.sqrt(delta_t) * z
+
+
+def get_bridge(delta_t):
+    # Breadth-first Brownian-bridge order: the terminal point first, then
+    # successive midpoints, each conditioned on its two bracketing points
+    times = np.concatenate([[0], np.cumsum(delta_t)])
+    n = len(delta_t)
+    bridge = []
+    intervals = deque([(0, n)])
+    while intervals:
+        left, right = intervals.popleft()
+        if right - left < 2:
+            continue
+        mid = (left + right) // 2
+        span = times[right] - times[left]
+        bridge.append((
+            mid, left, right,
+            (times[right] - times[mid]) / span,
+            (times[mid] - times[left]) / span,
+            np.sqrt((times[mid] - times[left]) * (times[right] - times[mid]) / span)
+        ))
+        intervals.extend([(left, mid), (mid, right)])
+    return times, bridge
+
+
+def get_bridge_normals(z, delta_t):
+    times, bridge = get_bridge(delta_t)
+    w = np.zeros((len(z), len(times)))
+    w[:, -1] = np.sqrt(times[-1]) * z[:, 0]
+    for k, (mid, left, right, a, b, c) in enumerate(bridge, 1):
+        w[:, mid] = a * w[:, left] + b * w[:, right] + c * z[:, k]
+    return np.diff(w, axis=1) / np.sqrt(delta_t)
+
+
+def get_sobol_normals(sims, delta_t, rng, scramble=None, offset=0):
+    # Scrambled Sobol points on the leading dimensions, which the bridge
+    # loads with most of the variance; any excess dimensions are padded
+    # with pseudo-random normals. With a scramble seed and an offset this is
+    # one aligned block of a longer sequence
+    steps = len(delta_t)
+    dims = min(steps, SOBOL_DIMENSIONS)
+    sobol = qmc.Sobol(dims, scramble=True, seed=rng if scramble is None else scramble)
+    if offset:
+        sobol.fast_forward(offset)
+    with warnings.catch_warnings():
+        # Sims need not be a power of two: a run of a replicate's sequence is
+        # balanced as part of the whole replicate, not on its own
+        warnings.simplefilter('ignore', UserWarning)
+        u = sobol.random(sims)
+    z = ndtri(np.clip(u, 1e-12, 1 - 1e-12))
+    if dims < steps:
+        z = np.concatenate([z, rng.standard_normal((len(z), steps - dims))], axis=1)
+    return get_bridge_normals(z, delta_t)
+
+
+def get_normals(sims, delta_t, rng, method='plain', scramble=None, offset=0):
+    steps = len(delta_t)
+    if method == 'sobol':
+        return get_sobol_normals(sims, delta_t, rng, scramble, offset)
+    if method == 'antithetic':
+        z = rng.standard_normal(((sims + 1) // 2, steps))
+        z = np.concatenate([z, -z])
+    else:
+        z = rng.standard_normal((sims, steps))
+    if method == 'moment':
+        z = (z - z.mean(axis=0)) / z.std(axis=0)
+    return z
+
+
+def get_paths(index, interest_rate, vol, delta_t, sims, rng=None, method='plain', scramble=None, offset=0):
+    rng = np.random.default_rng() if rng is None else rng
+    delta_t = np.asarray(delta_t, dtype=float)
+    z = get_normals(sims, delta_t, rng, method, scramble, offset)
+    log_paths = np.zeros((len(z), len(delta_t) + 1))
+    np.cumsum(get_log_increments(interest_rate, vol, delta_t, z), axis=1, out=log_paths[:, 1:])
+    return index * np.exp(log_paths)
+
+
+def get_samples(terminal, strike, flag, forward, method='plain'):
+    payoffs = pricing.get_payoffs(terminal, strike, flag)
+    if method == 'antithetic':
+        # Each antithetic pair is one independent sample
+        half = len(payoffs) // 2
+        return (payoffs[:half] + payoffs[half:]) / 2
+    if method == 'control':
+        # The terminal underlying has a known risk-neutral mean, the forward.
+        # Beta is only estimated once every chunk's co-moments are merged: a
+        # per-chunk beta applied to its own samples biases small chunks
+        return np.column_stack([payoffs, terminal - forward])
+    return payoffs
+
+
+def get_moments(samples):
+    # Count, mean and centred sum of squares; for columns of samples the
+    # means are a vector and the sums of squares and cross-products a matrix
+    mean = np.mean(samples, axis=0)
+    centred = samples - mean
+    return len(samples), mean, centred.T @ centred
+
+
+def merge_moments(a, b):
+    # Welford's update generalised to merging two chunks (Chan et al.)
+    n_a, mean_a, m2_a = a
+    n_b, mean_b, m2_b = b
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    return n, mean_a + delta * n_b / n, m2_a + m2_b + np.multiply.outer(delta, delta) * n_a * n_b / n
+
+
+def get_threshold(size, sims):
+    # Key cut-off a chunk applies before returning a reservoir: with this
+    # margin the batch's size smallest keys all fall below it bar a few-sigma
+    # event, which would only leave a smaller but still uniform sample
+    return min((size + 5 * np.sqrt(size)) / sims, 1)
+
+
+def get_reservoir(keys, values, size):
+    # Bottom-k sample: keeping the rows with the smallest uniform keys is a
+    # uniform sample without replacement, and merges exactly across chunks
+    order = np.argsort(keys, kind='stable')[:size]
+    return keys[order], values[order]
+
+
+def merge_reservoirs(a, b, size):
+    return get_reservoir(np.concatenate([a[0], b[0]]), np.concatenate([a[1], b[1]]), size)
+
+
+def get_statistics(moments, sims, payoffs):
+    n, mean, m2 = moments
+    dof = n - 1
+    if np.ndim(mean):
+        # Control variate: one beta off the merged co-moments of payoff and
+        # control, whose mean is known to be zero; the residual variance
+        # about the fitted line gives the standard error
+        beta = m2[0, 1] / m2[1, 1]
+        mean, m2, dof = mean[0] - beta * mean[1], m2[0, 0] - beta * m2[0, 1], n - 2
+    std = np.sqrt(m2 / dof) if dof > 0 else np.nan
+    return {
+        'sims': sims,
+        'samples': n,
+        'mean': mean,
+        'std': std,
+        'std_error': std / np.sqrt(n),
+        'quantiles': dict(zip(QUANTILES, np.percentile(payoffs[1], QUANTILES)))
+    }
+
+
+def get_fan(paths, quantiles=QUANTILES):
+    return np.percentile(paths, quantiles, axis=0)
+
+
+def get_chunks(sims, steps, method='plain'):
+    # (replicate, offset, sims) per chunk. Chunks hold about CHUNK_ELEMENTS
+    # path points whatever the step count
+    size = max(CHUNK_ELEMENTS // steps, MIN_CHUNK_SIZE)
+    if method == 'sobol':
+        # One independent scrambling per RQMC replicate of sims // 8 points.
+        # A replicate is cut into consecutive runs of its one sequence at
+        # power-of-two offsets, so together they are exactly the unsplit points
+        points = max(sims // QMC_REPLICATES, 2)
+        block = 2 ** int(np.log2(size))
+        return [
+            (replicate, offset, min(block, points - offset))
+            for replicate in range(QMC_REPLICATES) for offset in range(0, points, block)
+        ]
+    # Sims are spread evenly over the chunks so none is left with a path or
+    # two, which the moment and control estimators cannot use
+    count = max(int(np.ceil(sims / size)), 1)
+    sizes = [sims // count + 1] * (sims % count) + [sims // count] * (count - sims % count)
+    return [(chunk, 0, each) for chunk, each in enumerate(sizes)]
+
+
+def run_chunk(args):
+    index, interest_rate, vol, delta_t, strike, flag, sims, forward, discount, seed, offset, method, batch = args
+    if method == 'sobol':
+        # Blocks of one replicate share its scrambling, and draw their padding
+        # normals and reservoir keys from a stream of their own. Both are
+        # rebuilt from the seed's key: Sobol spawns off its generator's seed
+        # sequence, so a shared one would scramble every block differently
+        scramble = np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key + (0,))
+        rng = np.random.default_rng(np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key + (1, offset)))
+        paths = get_paths(index, interest_rate, vol, delta_t, sims, rng, method, np.random.default_rng(scramble), offset)
+    else:
+        rng = np.random.default_rng(seed)
+        paths = get_paths(index, interest_rate, vol, delta_t, sims, rng, method)
+    payoffs = discount * pricing.get_payoffs(paths[:, -1], strike, flag)
+    if method == 'sobol':
+        samples = payoffs
+    else:
+        samples = discount * get_samples(paths[:, -1], strike, flag, forward, method)
+    keys = rng.random(len(paths))
+    kept = keys < get_threshold(PATH_RESERVOIR, batch)
+    sampled = keys < get_threshold(PAYOFF_RESERVOIR, batch)
+    return (
+        len(paths),
+        get_moments(samples),
+        get_reservoir(keys[kept], paths[kept], PATH_RESERVOIR),
+        get_reservoir(keys[sampled], payoffs[sampled], PAYOFF_RESERVOIR)
+    )
+
+
+def run_chunks(tasks, workers):
+    # Results are yielded one at a time in task order, so the caller merges
+    # and drops each chunk before the next is held
+    if workers <= 1 or len(tasks) == 1:
+        return (run_chunk(task) for task in tasks)
+    return pool.get_executor(workers).map(run_chunk, tasks)
+
+
+def simulate(index, interest_rate, vol, delta_t, strike, flag, sims, method='plain', target_error=None, max_sims=None,
+             seed=None, workers=None):
+    # Every chunk draws from its own stream spawned off one master seed and
+    # chunks are merged in order, so results do not depend on the worker count.
+    # Only moments and bounded reservoirs survive a chunk, so memory stays flat.
+    seed_sequence = np.random.SeedSequence(seed)
+    workers = os.cpu_count() if workers is None else workers
+    expiry = np.sum(delta_t)
+    forward = index * np.exp(interest_rate * expiry)
+    discount = np.exp(-1 * interest_rate * expiry)
+    max_sims = sims if max_sims is None else max_sims
+
+    moments = None
+    paths = None
+    payoffs = None
+    total_sims = 0
+    while moments is None or (target_error and get_statistics(moments, total_sims, payoffs)['std_error'] > target_error
+                              and total_sims < max_sims):
+        chunks = get_chunks(sims, len(delta_t), method)
+        seeds = seed_sequence.spawn(chunks[-1][0] + 1)
+        batch = sum(chunk for _, _, chunk in chunks)
+        tasks = [
+            (index, interest_rate, vol, delta_t, strike, flag, chunk, forward, discount, seeds[replicate], offset,
+             method, batch)
+            for replicate, offset, chunk in chunks
+        ]
+        replicates = {}
+        for (replicate, _, _), (chunk_sims, chunk_moments, chunk_paths, chunk_payoffs) in zip(
+                chunks, run_chunks(tasks, workers)):
+            if method == 'sobol':
+                # The blocks of one RQMC replicate pool into its single sample
+                previous = replicates.get(replicate)
+                replicates[replicate] = chunk_moments if previous is None else merge_moments(previous, chunk_moments)
+            else:
+                moments = chunk_moments if moments is None else merge_moments(moments, chunk_moments)
+            if paths is None:
+                paths, payoffs = chunk_paths, chunk_payoffs
+            else:
+                paths = merge_reservoirs(paths, chunk_paths, PATH_RESERVOIR)
+                payoffs = merge_reservoirs(payoffs, chunk_payoffs, PAYOFF_RESERVOIR)
+            total_sims += chunk_sims
+        for _, mean, _ in replicates.values():
+            sample = get_moments(np.array([mean]))
+            moments = sample if moments is None else merge_moments(moments, sample)
+
+    return paths[1], get_statistics(moments, total_sims, payoffs)
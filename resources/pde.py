@@ -0,0 +1,89 @@
+import numpy as np
+
+from resources import pricing
+
+
+def get_thomas_factors(lower, diag, upper, n):
+    # Forward-elimination coefficients of a constant tridiagonal matrix,
+    # computed once and reused for every time step and right-hand side
+    c = np.empty(n)
+    inv = np.empty(n)
+    inv[0] = 1 / diag
+    c[0] = upper * inv[0]
+    for i in range(1, n):
+        inv[i] = 1 / (diag - lower * c[i - 1])
+        c[i] = upper * inv[i]
+    return lower, c, inv
+
+
+def thomas(factors, rhs):
+    lower, c, inv = factors
+    x = np.empty_like(rhs)
+    x[0] = rhs[0] * inv[0]
+    for i in range(1, len(rhs)):
+        x[i] = (rhs[i] - lower * x[i - 1]) * inv[i]
+    for i in range(len(rhs) - 2, -1, -1):
+        x[i] -= c[i] * x[i + 1]
+    return x
+
+
+def get_boundaries(s_min, s_max, strikes, call, interest_rate, tau, american=False):
+    discounted_k = strikes if american else strikes * np.exp(-1 * interest_rate * tau)
+    lower = np.where(call, 0, np.maximum(discounted_k - s_min, 0))
+    upper = np.where(call, s_max - strikes * np.exp(-1 * interest_rate * tau), 0)
+    return lower, upper
+
+
+def price_chain(index, strikes, expiry, vol, interest_rate, flag, american=False, space_steps=400, time_steps=200,
+                width=5, rannacher=2):
+    strikes, call = np.broadcast_arrays(np.asarray(strikes, dtype=float), pricing.is_call(flag))
+    shape = strikes.shape
+    strikes, call = strikes.ravel(), call.ravel()
+
+    # One log-spot grid wide enough for the spot and every strike; each
+    # (strike, flag) pair is a column of the same linear system
+    spread = width * vol * np.sqrt(expiry)
+    x = np.linspace(
+        min(np.log(index), np.log(strikes.min())) - spread,
+        max(np.log(index), np.log(strikes.max())) + spread,
+        space_steps + 1
+    )
+    dx = x[1] - x[0]
+    s = np.exp(x)
+    payoff = pricing.get_payoffs(s[:, None], strikes[None, :], call[None, :])
+
+    a = 0.5 * vol * vol / (dx * dx)
+    b = (interest_rate - 0.5 * vol * vol) / (2 * dx)
+    lower, diag, upper = a - b, -2 * a - interest_rate, a + b
+
+    # Rannacher start-up: implicit half-steps damp the payoff kinks before
+    # switching to Crank-Nicolson
+    d_tau = expiry / time_steps
+    rannacher = min(rannacher, time_steps)
+    schedule = [(1.0, d_tau / 2)] * (2 * rannacher) + [(0.5, d_tau)] * (time_steps - rannacher)
+    factors = {
+        key: get_thomas_factors(-key[0] * key[1] * lower, 1 - key[0] * key[1] * diag, -key[0] * key[1] * upper,
+                                space_steps - 1)
+        for key in set(schedule)
+    }
+
+    values = payoff.copy()
+    tau = 0
+    for theta, dt in schedule:
+        tau += dt
+        bound_lower, bound_upper = get_boundaries(s[0], s[-1], strikes, call, interest_rate, tau, american)
+        explicit = (1 - theta) * dt
+        rhs = values[1:-1] + explicit * (lower * values[:-2] + diag * values[1:-1] + upper * values[2:])
+        rhs[0] += theta * dt * lower * bound_lower
+        rhs[-1] += theta * dt * upper * bound_upper
+        values[1:-1] = thomas(factors[(theta, dt)], rhs)
+        values[0] = bound_lower
+        values[-1] = bound_upper
+        if american:
+            np.maximum(values, payoff, out=values)
+
+    # Every column shares the spot, so one set of interpolation weights serves all strikes
+    x_0 = np.log(index)
+    i = np.clip(np.searchsorted(x, x_0), 1, space_steps)
+    w = (x_0 - x[i - 1]) / dx
+    return ((1 - w) * values[i - 1] + w * values[i]).reshape(shape)
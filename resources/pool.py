@@ -0,0 +1,19 @@
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+executors = {}
+pool_lock = threading.Lock()
+
+
+def get_executor(workers):
+    # One long-lived pool per worker count, shared by the Monte Carlo and
+    # calibration paths. Workers come from a forkserver rather than a fork of
+    # the threaded server, and pools are never swapped out under a caller
+    with pool_lock:
+        executor = executors.get(workers)
+        if executor is None:
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('forkserver'))
+            executors[workers] = executor
+    return executor
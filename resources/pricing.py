@@ -1,40 +1,173 @@
-from scipy.stats import norm
-from math import log, sqrt, exp
+import numpy as np
+from scipy.special import ndtr
 
 
-def get_ds(s, k, t, v, r):
-    d1 = (log(s/k) + t * (r + ((v * v) / 2))) / (v * sqrt(t))
-    d2 = d1 - (v * sqrt(t))
+SQRT_2PI = np.sqrt(2 * np.pi)
+GREEKS = ['delta', 'gamma', 'vega', 'theta', 'rho', 'vanna', 'volga']
+
+
+def norm_pdf(x):
+    return np.exp(-0.5 * x * x) / SQRT_2PI
+
+
+def is_call(flag):
+    flag = np.asarray(flag)
+    if flag.dtype == bool:
+        return flag
+    return np.char.lower(flag.astype(str)) == 'c'
+
+
+def get_ds_array(s, k, t, v, r):
+    s, k, t, v, r = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (s, k, t, v, r)])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vol_sqrt_t = v * np.sqrt(t)
+        d1 = (np.log(s / k) + t * (r + ((v * v) / 2))) / vol_sqrt_t
+        d2 = d1 - vol_sqrt_t
     return d1, d2
 
 
-def vega(s, k, t, v, r):
-    d1, d2 = get_ds(s, k, t, v, r)
-    option_vega = s * norm.pdf(d1) * sqrt(t)
+def vega_array(s, k, t, v, r):
+    d1, d2 = get_ds_array(s, k, t, v, r)
+    with np.errstate(invalid='ignore'):
+        option_vega = np.asarray(s, dtype=float) * norm_pdf(d1) * np.sqrt(np.asarray(t, dtype=float))
     return option_vega
 
 
-def black_scholes(s, k, t, v, r, flag):
-    d1, d2 = get_ds(s, k, t, v, r)
-    if flag == 'c':
-        px = s * norm.cdf(d1) - k * norm.cdf(d2) * exp(-1 * r * t)
-    else:
-        px = k * norm.cdf(-1 * d2) * exp(-1 * r * t) - s * norm.cdf(-1 * d1)
+def black_scholes_array(s, k, t, v, r, flag):
+    d1, d2 = get_ds_array(s, k, t, v, r)
+    s, k, t, r, call = np.broadcast_arrays(
+        np.asarray(s, dtype=float), np.asarray(k, dtype=float), np.asarray(t, dtype=float),
+        np.asarray(r, dtype=float), is_call(flag)
+    )
+    sign = np.where(call, 1.0, -1.0)
+    with np.errstate(invalid='ignore'):
+        px = sign * (s * ndtr(sign * d1) - k * ndtr(sign * d2) * np.exp(-1 * r * t))
     return px
 
 
-def get_implied_vol(m_px, s, k, t, r, flag, tolerance=0.001, epsilon=1, max_iterations=1000):
-    v = 0.5
-    count = 0
-    while epsilon > tolerance:
-        count += 1
-        if count >= max_iterations:
-            print('Max iterations reached. Exiting...')
-            return None
-        prev_v = v
-        diff = black_scholes(s, k, t, v, r, flag) - m_px
-        option_vega = vega(s, k, t, v, r)
-        v = -diff / option_vega + v
-        epsilon = abs((v - prev_v) / prev_v)
-    return v
+def get_greeks_array(s, k, t, v, r, flag):
+    # Analytic Black-Scholes Greeks off one d1/d2 evaluation. Vega, volga and
+    # rho are per unit of vol/rate, theta per year
+    d1, d2 = get_ds_array(s, k, t, v, r)
+    s, k, t, v, r, call = np.broadcast_arrays(
+        np.asarray(s, dtype=float), np.asarray(k, dtype=float), np.asarray(t, dtype=float),
+        np.asarray(v, dtype=float), np.asarray(r, dtype=float), is_call(flag)
+    )
+    sign = np.where(call, 1.0, -1.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pdf = norm_pdf(d1)
+        sqrt_t = np.sqrt(t)
+        discounted_k = k * np.exp(-1 * r * t)
+        option_vega = s * pdf * sqrt_t
+        return {
+            'delta': ndtr(d1) - np.where(call, 0.0, 1.0),
+            'gamma': pdf / (s * v * sqrt_t),
+            'vega': option_vega,
+            'theta': -1 * s * pdf * v / (2 * sqrt_t) - sign * r * discounted_k * ndtr(sign * d2),
+            'rho': sign * t * discounted_k * ndtr(sign * d2),
+            'vanna': -1 * pdf * d2 / v,
+            'volga': option_vega * d1 * d2 / v,
+        }
+
+
+def get_payoffs(underlying, strike, flag):
+    underlying = np.asarray(underlying, dtype=float)
+    return np.where(is_call(flag), np.maximum(underlying - strike, 0), np.maximum(strike - underlying, 0))
+
+
+def get_ds(s, k, t, v, r):
+    d1, d2 = get_ds_array(s, k, t, v, r)
+    return float(d1), float(d2)
+
+
+def vega(s, k, t, v, r):
+    return float(vega_array(s, k, t, v, r))
 
+
+def black_scholes(s, k, t, v, r, flag):
+    return float(black_scholes_array(s, k, t, v, r, flag))
+
+
+def get_greeks(s, k, t, v, r, flag):
+    return {greek: float(value) for greek, value in get_greeks_array(s, k, t, v, r, flag).items()}
+
+
+def get_initial_vol(m_px, s, k, t, r, call):
+    # Corrado-Miller rational approximation on the call price, with puts
+    # mapped through put-call parity. Falls back to Brenner-Subrahmanyam
+    # where the discriminant goes negative.
+    discounted_k = k * np.exp(-1 * r * t)
+    call_px = np.where(call, m_px, m_px + s - discounted_k)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        half_moneyness = (s - discounted_k) / 2
+        discriminant = (call_px - half_moneyness) ** 2 - ((s - discounted_k) ** 2) / np.pi
+        corrado_miller = SQRT_2PI / (np.sqrt(t) * (s + discounted_k)) * (
+            call_px - half_moneyness + np.sqrt(np.maximum(discriminant, 0))
+        )
+        brenner = SQRT_2PI * call_px / (s * np.sqrt(t))
+    return np.where(discriminant > 0, corrado_miller, brenner)
+
+
+def get_implied_vol_array(m_px, s, k, t, r, flag, tolerance=1e-6, max_iterations=100, v_min=1e-4, v_max=10.0,
+                          initial_vol=None):
+    m_px, s, k, t, r, call = np.broadcast_arrays(
+        np.asarray(m_px, dtype=float), np.asarray(s, dtype=float), np.asarray(k, dtype=float),
+        np.asarray(t, dtype=float), np.asarray(r, dtype=float), is_call(flag)
+    )
+    shape = m_px.shape
+    m_px, s, k, t, r, call = [x.ravel() for x in (m_px, s, k, t, r, call)]
+
+    # Only quotes strictly inside the no-arbitrage bounds have an implied vol
+    with np.errstate(invalid='ignore', over='ignore'):
+        discounted_k = k * np.exp(-1 * r * t)
+        lower = np.where(call, np.maximum(s - discounted_k, 0), np.maximum(discounted_k - s, 0))
+        upper = np.where(call, s, discounted_k)
+        active = (
+            np.isfinite(m_px) & np.isfinite(s) & np.isfinite(k) & np.isfinite(t) & np.isfinite(r)
+            & (s > 0) & (k > 0) & (t > 0) & (m_px > lower) & (m_px < upper)
+        )
+
+    v = np.full(m_px.shape, np.nan)
+    v[active] = get_initial_vol(m_px[active], s[active], k[active], t[active], r[active], call[active])
+    if initial_vol is not None:
+        # Warm start from a previous solve wherever one is available
+        initial_vol = np.broadcast_to(np.asarray(initial_vol, dtype=float), shape).ravel()
+        v = np.where(np.isfinite(initial_vol), initial_vol, v)
+    v = np.clip(np.nan_to_num(v, nan=0.5), v_min, v_max)
+    lo = np.full(m_px.shape, v_min)
+    hi = np.full(m_px.shape, v_max)
+    converged = np.zeros(m_px.shape, dtype=bool)
+
+    for _ in range(max_iterations):
+        idx = np.flatnonzero(active)
+        if not len(idx):
+            break
+        v_i = v[idx]
+        diff = black_scholes_array(s[idx], k[idx], t[idx], v_i, r[idx], call[idx]) - m_px[idx]
+        option_vega = vega_array(s[idx], k[idx], t[idx], v_i, r[idx])
+
+        # Price is increasing in vol, so each evaluation tightens the bracket
+        above = diff > 0
+        hi[idx] = np.where(above, v_i, hi[idx])
+        lo[idx] = np.where(above, lo[idx], v_i)
+
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            newton = v_i - diff / option_vega
+        use_newton = (option_vega > 1e-8 * s[idx]) & (newton > lo[idx]) & (newton < hi[idx])
+        v_new = np.where(use_newton, newton, (lo[idx] + hi[idx]) / 2)
+
+        done = np.abs(v_new - v_i) < tolerance
+        v[idx] = v_new
+        converged[idx[done]] = True
+        active[idx[done]] = False
+
+    # A root pinned to the edge of the bracket lies outside [v_min, v_max]
+    converged &= (v > v_min * (1 + 1e-6)) & (v < v_max * (1 - 1e-6))
+    return np.where(converged, v, np.nan).reshape(shape)
+
+
+def get_implied_vol(m_px, s, k, t, r, flag, tolerance=1e-6, max_iterations=100):
+    v = float(get_implied_vol_array(m_px, s, k, t, r, flag, tolerance, max_iterations))
+    if np.isnan(v):
+        return None
+    return v
@@ -0,0 +1,157 @@
+import time
+import threading
+
+import pandas as pd
+
+import config
+from resources import functions, metrics, calibration, grid
+
+
+snapshots = {}
+producers = {}
+snapshot_lock = threading.Lock()
+snapshot_ready = {}
+
+
+def build_snapshot(coin, version, previous=None):
+    functions.prefetch([('markets',), ('tickers', coin), ('index', coin)])
+    markets = functions.get_markets(coin, ['option'])
+    tickers = functions.get_tickers(coin)
+    return {
+        'coin': coin,
+        'version': version,
+        'timestamp': time.time(),
+        'markets': markets,
+        'tickers': tickers,
+        'index': tickers['index_price'].iloc[0] if len(tickers) else functions.get_index(coin),
+        'options': {},
+        'fits': {},
+        'grids': {},
+        'greeks': {},
+        'previous': {} if previous is None else previous['options'],
+        'lock': threading.Lock()
+    }
+
+
+def publish(snapshot):
+    with snapshot_lock:
+        snapshots[snapshot['coin']] = snapshot
+    snapshot_ready[snapshot['coin']].set()
+
+
+def run_producer(coin):
+    # One producer per coin: fetch the chain once per tick, solve IVs for the
+    # default rates once, and publish; every session reads the same snapshot
+    version = 0
+    while True:
+        try:
+            version += 1
+            with snapshot_lock:
+                previous = snapshots.get(coin)
+            snapshot = build_snapshot(coin, version, previous)
+            for interest_rate in config.SNAPSHOT_INTEREST_RATES:
+                get_chain_greeks(snapshot, interest_rate)
+            publish(snapshot)
+        except Exception as e:
+            print(e)
+        time.sleep(config.SNAPSHOT_INTERVAL)
+
+
+def start_producer(coin):
+    with snapshot_lock:
+        if coin in producers:
+            return
+        snapshot_ready[coin] = threading.Event()
+        producers[coin] = threading.Thread(target=run_producer, args=(coin,), daemon=True)
+        producers[coin].start()
+
+
+def get_snapshot(coin):
+    coin = coin.upper()
+    start_producer(coin)
+    with metrics.stage('fetch'):
+        if not snapshot_ready[coin].wait(config.SNAPSHOT_TIMEOUT):
+            raise TimeoutError('No {} snapshot published yet'.format(coin))
+    with snapshot_lock:
+        return snapshots[coin]
+
+
+def get_chain(snapshot, interest_rate):
+    # IVs depend on the rate, so they are solved at most once per snapshot and
+    # rate, incrementally against the previous snapshot's chain at that rate
+    with snapshot['lock'], metrics.stage('iv'):
+        options = snapshot['options'].get(interest_rate)
+        if options is None:
+            options = functions.prepare_options(
+                snapshot['markets'].copy(), snapshot['tickers'], [], interest_rate,
+                snapshot['previous'].get(interest_rate)
+            )
+            snapshot['options'][interest_rate] = options
+    return options
+
+
+def get_chain_greeks(snapshot, interest_rate):
+    options = get_chain(snapshot, interest_rate)
+    with snapshot['lock']:
+        greeks = snapshot['greeks'].get(interest_rate)
+        if greeks is None:
+            greeks = functions.add_greeks(options)
+            snapshot['greeks'][interest_rate] = greeks
+    return greeks
+
+
+def get_book_greeks(interest_rate, coins=None):
+    # The whole book's chains with Greeks, computed once per snapshot so risk
+    # screens can poll at the snapshot cadence
+    coins = config.COINS if coins is None else coins
+    return pd.concat(
+        [get_chain_greeks(get_snapshot(coin), interest_rate).assign(coin=coin.upper()) for coin in coins],
+        ignore_index=True
+    )
+
+
+def get_snapshot_fits(snapshot, interest_rate, side, cp, model='svi'):
+    # Smile parameters per expiry, fitted at most once per snapshot for each
+    # rate, side, call/put and model; callers only look them up
+    options = get_chain(snapshot, interest_rate)
+    key = (interest_rate, side, cp, model)
+    with snapshot['lock'], metrics.stage('calibration'):
+        fits = snapshot['fits'].get(key)
+        if fits is None:
+            fits = calibration.calibrate(
+                options[options['flag'] == cp], side, model, config.CALIBRATION_WORKERS
+            )
+            snapshot['fits'][key] = fits
+    return fits
+
+
+def get_fits(coin, interest_rate, side, cp, model='svi'):
+    return get_snapshot_fits(get_snapshot(coin), interest_rate, side, cp, model)
+
+
+def get_grid(coin, interest_rate, side, cp, model='svi'):
+    # Dense total-variance grid built once per snapshot from its fits, so any
+    # (strike, expiry) is priced without refitting. The snapshot is resolved
+    # once: a refresh in between would pair one snapshot's fits with another's index
+    snapshot = get_snapshot(coin)
+    fits = get_snapshot_fits(snapshot, interest_rate, side, cp, model)
+    key = (interest_rate, side, cp, model)
+    with snapshot['lock']:
+        surface = snapshot['grids'].get(key)
+        if surface is None:
+            surface = grid.build(
+                fits, snapshot['index'], interest_rate / 100, config.GRID_MONEYNESS_WIDTH, config.GRID_POINTS
+            )
+            snapshot['grids'][key] = surface
+    return surface
+
+
+def get_options(coin, interest_rate, maturity=None):
+    options = get_chain(get_snapshot(coin), interest_rate)
+    if maturity:
+        options = options[options['expiration_timestamp'].dt.strftime('%d-%B-%Y').isin(maturity)]
+    return options.copy()
+
+
+def get_index(coin):
+    return get_snapshot(coin)['index']
@@ -0,0 +1,172 @@
+import os
+import sys
+import time
+import threading
+
+import numpy as np
+import pandas as pd
+
+import config
+
+
+SCHEMAS = {
+    'markets': [
+        ('instrument_name', 'U48'), ('kind', 'U16'), ('base_currency', 'U8'), ('strike', 'f8'),
+        ('expiration_timestamp', 'i8')
+    ],
+    'tickers': [
+        ('instrument_name', 'U48'), ('mid_price', 'f8'), ('bid_price', 'f8'), ('ask_price', 'f8'),
+        ('mark_price', 'f8'), ('open_interest', 'f8'), ('underlying_price', 'f8')
+    ],
+    'index': [('price', 'f8')],
+}
+SNAPSHOT_DTYPE = np.dtype([('timestamp', 'i8'), ('end', 'i8')])
+
+store_lock = threading.Lock()
+memmaps = {}
+replay_started = None
+
+
+def get_path(key, name=None):
+    directory = os.path.join(config.STORE_PATH, '_'.join(key))
+    return directory if name is None else os.path.join(directory, '{}.bin'.format(name))
+
+
+def get_columns(key, value):
+    if key[0] == 'index':
+        value = pd.DataFrame({'price': [value]})
+    columns = {}
+    for column, dtype in SCHEMAS[key[0]]:
+        values = value[column] if column in value else pd.Series(np.nan, index=value.index)
+        if dtype.startswith('U'):
+            columns[column] = values.fillna('').astype(str).to_numpy(dtype=dtype)
+        else:
+            values = pd.to_numeric(values, errors='coerce')
+            columns[column] = (values.fillna(0) if dtype == 'i8' else values).to_numpy(dtype=dtype)
+    return columns
+
+
+def record(key, value, timestamp=None):
+    # Each column is appended to its own flat binary file; the snapshot index
+    # is written last so readers never see a half-written snapshot
+    if key[0] not in SCHEMAS:
+        return
+    timestamp = int(time.time() * 1000) if timestamp is None else timestamp
+    columns = get_columns(key, value)
+    with store_lock:
+        os.makedirs(get_path(key), exist_ok=True)
+        for column, values in columns.items():
+            with open(get_path(key, column), 'ab') as column_file:
+                column_file.write(values.tobytes())
+        first, dtype = SCHEMAS[key[0]][0]
+        end = os.path.getsize(get_path(key, first)) // np.dtype(dtype).itemsize
+        with open(get_path(key, 'snapshots'), 'ab') as snapshot_file:
+            snapshot_file.write(np.array([(timestamp, end)], dtype=SNAPSHOT_DTYPE).tobytes())
+
+
+def open_memmap(path, dtype):
+    # Memory maps are reopened only when the file has grown since the last read
+    dtype = np.dtype(dtype)
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    cached = memmaps.get(path)
+    if cached is None or cached[0] != size:
+        length = size // dtype.itemsize
+        array = np.memmap(path, dtype=dtype, mode='r', shape=(length,)) if length else np.empty(0, dtype=dtype)
+        memmaps[path] = cached = (size, array)
+    return cached[1]
+
+
+def get_snapshots(key):
+    return open_memmap(get_path(key, 'snapshots'), SNAPSHOT_DTYPE)
+
+
+def scan(key, columns=None, start=None, end=None):
+    # Zero-copy views over every snapshot recorded in [start, end] (ms); row
+    # ranges of individual snapshots follow from the returned 'end' offsets
+    snapshots = get_snapshots(key)
+    first = 0 if start is None else np.searchsorted(snapshots['timestamp'], start, side='left')
+    last = len(snapshots) if end is None else np.searchsorted(snapshots['timestamp'], end, side='right')
+    snapshots = snapshots[first:last]
+    if not len(snapshots):
+        return snapshots, {}
+    row_start = get_snapshots(key)['end'][first - 1] if first else 0
+    dtypes = dict(SCHEMAS[key[0]])
+    return snapshots, {
+        column: open_memmap(get_path(key, column), dtypes[column])[row_start:snapshots['end'][-1]]
+        for column in (columns or dtypes)
+    }
+
+
+def read(key, timestamp):
+    # The latest snapshot recorded at or before timestamp (ms), in the shape
+    # the live client returns
+    snapshots = get_snapshots(key)
+    i = np.searchsorted(snapshots['timestamp'], timestamp, side='right') - 1
+    if i < 0:
+        raise LookupError('No {} snapshot recorded at or before {}'.format('_'.join(key), timestamp))
+    start = snapshots['end'][i - 1] if i else 0
+    frame = pd.DataFrame({
+        column: open_memmap(get_path(key, column), dtype)[start:snapshots['end'][i]]
+        for column, dtype in SCHEMAS[key[0]]
+    })
+    if key[0] == 'index':
+        return float(frame['price'].iloc[0])
+    return frame
+
+
+def get_recorded_range():
+    timestamps = [
+        get_snapshots((name,) if name == 'markets' else tuple(name.split('_', 1)))['timestamp']
+        for name in os.listdir(config.STORE_PATH)
+    ] if os.path.isdir(config.STORE_PATH) else []
+    timestamps = [each for each in timestamps if len(each)]
+    if not timestamps:
+        raise LookupError('Nothing recorded under {}'.format(config.STORE_PATH))
+    # Replay starts once every recorded key has its first snapshot
+    return max(each[0] for each in timestamps), max(each[-1] for each in timestamps)
+
+
+def get_replay_time():
+    # Recorded time advances with wall time, scaled by config.REPLAY_SPEED, from
+    # config.REPLAY_START (or the first recording) and loops at the end
+    global replay_started
+    first, last = get_recorded_range()
+    start = first if config.REPLAY_START is None else config.REPLAY_START
+    with store_lock:
+        if replay_started is None:
+            replay_started = time.time()
+    elapsed = int((time.time() - replay_started) * 1000 * config.REPLAY_SPEED)
+    return first + (start - first + elapsed) % (last - first + 1)
+
+
+def fetch(key, timestamp):
+    value = read(key, timestamp)
+    if key[0] == 'markets':
+        # Shift expiries so time to expiry matches what it was when recorded
+        value['expiration_timestamp'] += int(time.time() * 1000) - timestamp
+    return value
+
+
+def fetch_many(keys):
+    # Same contract as client.fetch_many: one result or exception per key
+    timestamp = get_replay_time()
+    results = []
+    for key in keys:
+        try:
+            results.append(fetch(key, timestamp))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+if __name__ == '__main__':
+    # Standalone recorder: python -m resources.store [COIN ...]
+    from resources import functions
+    config.STORE_RECORD = True
+    coins = [coin.upper() for coin in sys.argv[1:]] or config.COINS
+    while True:
+        try:
+            functions.prefetch([('markets',)] + [(kind, coin) for coin in coins for kind in ['tickers', 'index']])
+        except Exception as e:
+            print(e)
+        time.sleep(config.STORE_RECORD_INTERVAL)
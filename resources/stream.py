@@ -0,0 +1,154 @@
+import json
+import asyncio
+import threading
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+import websockets
+
+import config
+from resources import pricing
+
+
+TICKER_FIELDS = [
+    'best_bid_price', 'best_ask_price', 'best_bid_amount', 'best_ask_amount', 'mark_price', 'open_interest', 'timestamp'
+]
+QUOTE_FIELDS = ['best_bid_price', 'best_ask_price']
+
+book = {}
+indexes = {}
+dirty = set()
+book_lock = threading.Lock()
+streams = {}
+
+
+def get_channels(instruments, coins):
+    return (
+        ['ticker.{}.100ms'.format(i) for i in instruments]
+        + ['deribit_price_index.{}_usd'.format(coin.lower()) for coin in coins]
+    )
+
+
+def init_book(markets):
+    with book_lock:
+        for each_dict in markets.to_dict('records'):
+            book[each_dict['instrument_name']] = {
+                'instrument_name': each_dict['instrument_name'],
+                'coin': each_dict['base_currency'],
+                'strike': each_dict['strike'],
+                'flag': each_dict['instrument_name'].split('-')[-1].lower(),
+                'expiration_timestamp': pd.Timestamp(each_dict['expiration_timestamp']),
+            }
+
+
+def on_ticker(data):
+    row = book.get(data['instrument_name'])
+    if row is None:
+        return
+    changed = any(row.get(field) != data.get(field) for field in QUOTE_FIELDS)
+    row.update({field: data.get(field) for field in TICKER_FIELDS})
+    if changed:
+        dirty.add(data['instrument_name'])
+
+
+def on_index(data):
+    coin = data['index_name'].split('_')[0].upper()
+    if indexes.get(coin) != data['price']:
+        indexes[coin] = data['price']
+        dirty.update(name for name, row in book.items() if row['coin'] == coin)
+
+
+def on_message(message):
+    message = json.loads(message)
+    if 'error' in message:
+        # A rejected subscribe would otherwise leave the book silently empty
+        print('Stream error: {}'.format(message['error']))
+        return
+    if message.get('method') != 'subscription':
+        return
+    channel = message['params']['channel']
+    with book_lock:
+        if channel.startswith('ticker.'):
+            on_ticker(message['params']['data'])
+        elif channel.startswith('deribit_price_index.'):
+            on_index(message['params']['data'])
+
+
+def update_ivs(interest_rate):
+    # Only instruments whose quotes or index moved since the last pass are
+    # re-solved, all sides in one batched call
+    with book_lock:
+        rows = [book[name] for name in dirty if 'best_bid_price' in book[name]]
+        dirty.clear()
+        if not rows:
+            return 0
+        index = np.array([indexes.get(row['coin'], np.nan) for row in rows], dtype=float)
+        bid = np.array([row['best_bid_price'] or np.nan for row in rows], dtype=float)
+        ask = np.array([row['best_ask_price'] or np.nan for row in rows], dtype=float)
+        strike = np.array([row['strike'] for row in rows], dtype=float)
+        flag = np.array([row['flag'] for row in rows])
+        expiration = np.array([row['expiration_timestamp'].timestamp() for row in rows])
+
+    until_expiry = (expiration - dt.datetime.now().timestamp()) / 31556952
+    prices = np.concatenate([(bid + ask) / 2, bid, ask]) * np.tile(index, 3)
+    iv = pricing.get_implied_vol_array(
+        prices, np.tile(index, 3), np.tile(strike, 3), np.tile(until_expiry, 3), interest_rate / 100, np.tile(flag, 3)
+    )
+    iv = np.round(100 * iv, 2).reshape(3, len(rows))
+
+    with book_lock:
+        for i, row in enumerate(rows):
+            row['index_price'] = index[i]
+            row['iv_mid'], row['iv_bids'], row['iv_asks'] = iv[:, i]
+    return len(rows)
+
+
+def get_book(coin=None):
+    with book_lock:
+        rows = [dict(row) for row in book.values() if coin is None or row['coin'] == coin.upper()]
+    return pd.DataFrame(rows)
+
+
+async def run_iv_updates(interest_rate):
+    while True:
+        update_ivs(interest_rate)
+        await asyncio.sleep(config.STREAM_IV_INTERVAL)
+
+
+async def run_stream(markets, coins, interest_rate, url=None):
+    url = config.STREAM_URL if url is None else url
+    init_book(markets)
+    channels = get_channels(list(markets['instrument_name']), coins)
+    iv_task = asyncio.ensure_future(run_iv_updates(interest_rate))
+    try:
+        while True:
+            try:
+                async with websockets.connect(url, max_size=None) as websocket:
+                    await websocket.send(json.dumps({
+                        'jsonrpc': '2.0', 'id': 1, 'method': 'public/subscribe', 'params': {'channels': channels}
+                    }))
+                    async for message in websocket:
+                        # A malformed notification is skipped, not worth a reconnect
+                        try:
+                            on_message(message)
+                        except (ValueError, KeyError, TypeError, AttributeError) as e:
+                            print(e)
+            except (OSError, websockets.WebSocketException) as e:
+                # Dropped connections and rejected handshakes reconnect and
+                # resubscribe rather than end the stream
+                print(e)
+                await asyncio.sleep(config.STREAM_RECONNECT)
+    finally:
+        iv_task.cancel()
+
+
+def start_stream(markets, coins, interest_rate, url=None):
+    # The asyncio loop runs in its own daemon thread next to the Dash server
+    key = (tuple(coins), url)
+    if key not in streams:
+        streams[key] = threading.Thread(
+            target=asyncio.run, args=(run_stream(markets, coins, interest_rate, url),), daemon=True
+        )
+        streams[key].start()
+    return streams[key]